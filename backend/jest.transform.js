@@ -0,0 +1,25 @@
+// Jest transform for the TypeScript sources, using the compiler already in
+// devDependencies (no ts-jest/babel needed).
+const path = require('path');
+const ts = require('typescript');
+const tsconfig = require('./tsconfig.json');
+
+const { options } = ts.convertCompilerOptionsFromJson(tsconfig.compilerOptions, __dirname);
+const compilerOptions = {
+  ...options,
+  declaration: false,
+  declarationMap: false,
+  sourceMap: false,
+  inlineSourceMap: true,
+  inlineSources: true,
+};
+
+module.exports = {
+  process(sourceText, sourcePath) {
+    const { outputText } = ts.transpileModule(sourceText, {
+      fileName: path.relative(__dirname, sourcePath),
+      compilerOptions,
+    });
+    return { code: outputText };
+  },
+};
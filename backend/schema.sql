@@ -69,6 +69,8 @@ CREATE INDEX IF NOT EXISTS idx_locations_user_device ON locations(user_id, devic
 CREATE INDEX IF NOT EXISTS idx_locations_user_timestamp ON locations(user_id, timestamp DESC);
 CREATE INDEX IF NOT EXISTS idx_locations_device_timestamp ON locations(device_id, timestamp DESC);
 CREATE INDEX IF NOT EXISTS idx_locations_timestamp ON locations(timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_locations_user_lat_lng ON locations(user_id, latitude, longitude); -- viewport queries
+CREATE INDEX IF NOT EXISTS idx_locations_user_device_created ON locations(user_id, device_id, created_at, id); -- segment catch-up
 
 -- Spatial index for geo queries (optional, requires PostGIS)
 -- CREATE INDEX idx_locations_coordinates ON locations USING GIST(point(longitude, latitude));
@@ -105,6 +107,23 @@ CREATE TABLE IF NOT EXISTS client_tokens (
 CREATE INDEX IF NOT EXISTS idx_client_tokens_user ON client_tokens(user_id);
 CREATE UNIQUE INDEX IF NOT EXISTS uniq_client_tokens_token_hash ON client_tokens(token_hash);
 
+-- Resume points for the SQLite -> PostgreSQL migration tool (src/migrate-sqlite.ts)
+CREATE TABLE IF NOT EXISTS migration_checkpoints (
+    source VARCHAR(512) PRIMARY KEY, -- SQLite path + target user
+    last_id BIGINT NOT NULL DEFAULT 0, -- highest legacy row id committed
+    rows_copied BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Stay/trip segmentation state per device, with its insertion-order cursor (src/segments.ts)
+CREATE TABLE IF NOT EXISTS segment_state (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    device_id VARCHAR(255) NOT NULL,
+    state JSONB NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, device_id)
+);
+
 -- Demo/migration user for existing data
 INSERT INTO users (id, email, password_hash, display_name, is_active) 
 VALUES (
@@ -0,0 +1,158 @@
+// Streaming migration of the legacy SQLite `locations` table into PostgreSQL.
+//
+// Rows are read with a keyset cursor over the SQLite primary key and written
+// in chunks, each in its own transaction together with a checkpoint, so an
+// interrupted run picks up after the last committed chunk.
+//
+// Usage:
+//   npx tsx src/migrate-sqlite.ts [--sqlite ./data/findmycat.db]
+//     [--user <uuid>] [--chunk-size 1000] [--reset]
+import 'dotenv/config';
+import sqlite3 from 'sqlite3';
+import path from 'path';
+import fs from 'fs';
+import { PostgresDatabase, LegacyLocationRow } from './postgres';
+
+const DEMO_USER_ID = '00000000-0000-0000-0000-000000000000';
+
+interface MigrateOptions {
+  sqlitePath: string;
+  userId: string;
+  chunkSize: number;
+  reset: boolean;
+}
+
+const parseArgs = (argv: string[]): MigrateOptions => {
+  const options: MigrateOptions = {
+    sqlitePath: './data/findmycat.db',
+    userId: DEMO_USER_ID,
+    chunkSize: 1000,
+    reset: false,
+  };
+  for (let i = 0; i < argv.length; i++) {
+    const arg = argv[i];
+    if (arg === '--sqlite') options.sqlitePath = argv[++i];
+    else if (arg === '--user') options.userId = argv[++i];
+    else if (arg === '--chunk-size') options.chunkSize = parseInt(argv[++i]);
+    else if (arg === '--reset') options.reset = true;
+    else throw new Error(`Unknown argument: ${arg}`);
+  }
+  if (!options.sqlitePath) throw new Error('--sqlite requires a path');
+  if (!options.userId) throw new Error('--user requires a user id');
+  if (!Number.isInteger(options.chunkSize) || options.chunkSize <= 0) {
+    throw new Error('--chunk-size must be a positive integer');
+  }
+  return options;
+};
+
+const sqliteGet = <T>(db: sqlite3.Database, sql: string, params: any[] = []): Promise<T> =>
+  new Promise((resolve, reject) => {
+    db.get(sql, params, (err: Error | null, row: any) => (err ? reject(err) : resolve(row as T)));
+  });
+
+const sqliteAll = <T>(db: sqlite3.Database, sql: string, params: any[] = []): Promise<T[]> =>
+  new Promise((resolve, reject) => {
+    db.all(sql, params, (err: Error | null, rows: any[]) => (err ? reject(err) : resolve(rows as T[])));
+  });
+
+const readChunk = (db: sqlite3.Database, afterId: number, limit: number) =>
+  sqliteAll<LegacyLocationRow & { id: number }>(
+    db,
+    `SELECT id, deviceId, latitude, longitude, timestamp
+     FROM locations
+     WHERE id > ?
+     ORDER BY id
+     LIMIT ?`,
+    [afterId, limit]
+  );
+
+async function migrate(options: MigrateOptions): Promise<boolean> {
+  const sqlitePath = path.resolve(options.sqlitePath);
+  if (!fs.existsSync(sqlitePath)) {
+    throw new Error(`SQLite database not found: ${sqlitePath}`);
+  }
+
+  const sqlite = new sqlite3.Database(sqlitePath, sqlite3.OPEN_READONLY);
+  const db = new PostgresDatabase();
+  const source = `${sqlitePath}:${options.userId}`;
+
+  try {
+    await db.ensureMigrationCheckpoints();
+    if (options.reset) {
+      await db.resetMigrationCheckpoint(source);
+    }
+
+    const checkpoint = await db.getMigrationCheckpoint(source);
+    let lastId = checkpoint?.last_id ?? 0;
+    let copied = checkpoint?.rows_copied ?? 0;
+    let inserted = 0;
+
+    const { total } = await sqliteGet<{ total: number }>(sqlite, 'SELECT COUNT(*) as total FROM locations');
+    console.log(`🚚 Migrating ${total} rows from ${sqlitePath} (chunk size ${options.chunkSize})`);
+    if (checkpoint) {
+      console.log(`↩️  Resuming after row id ${lastId} (${copied} rows already copied)`);
+    }
+
+    const started = Date.now();
+    let rows = await readChunk(sqlite, lastId, options.chunkSize);
+    while (rows.length > 0) {
+      const chunkLastId = rows[rows.length - 1].id;
+      // Read the next chunk while this one is being written
+      const next = readChunk(sqlite, chunkLastId, options.chunkSize);
+      next.catch(() => undefined); // surfaced when awaited below
+
+      inserted += await db.migrateLocationChunk(options.userId, rows, { source, lastId: chunkLastId });
+      lastId = chunkLastId;
+      copied += rows.length;
+
+      const elapsed = (Date.now() - started) / 1000;
+      const pct = total > 0 ? ((copied / total) * 100).toFixed(1) : '100.0';
+      console.log(`   ${copied}/${total} rows (${pct}%), ${inserted} inserted, ${(inserted / Math.max(elapsed, 0.001)).toFixed(0)} rows/s`);
+
+      rows = await next;
+    }
+
+    // Verify: every legacy (device, timestamp) key must exist in PostgreSQL.
+    // Only the migrated keys are checked, so live data can't mask a gap.
+    let checked = 0;
+    let missing = 0;
+    let verifyRows = await readChunk(sqlite, 0, options.chunkSize);
+    while (verifyRows.length > 0) {
+      const next = readChunk(sqlite, verifyRows[verifyRows.length - 1].id, options.chunkSize);
+      next.catch(() => undefined);
+
+      missing += await db.countMissingLocations(options.userId, verifyRows);
+      checked += verifyRows.length;
+
+      verifyRows = await next;
+    }
+
+    if (missing === 0) {
+      console.log(`✅ Verified: all ${checked} legacy rows are present in PostgreSQL`);
+      return true;
+    }
+    console.error(`❌ Verification failed: ${missing} legacy (device, timestamp) keys missing from PostgreSQL`);
+    return false;
+  } finally {
+    sqlite.close();
+    await db.close();
+  }
+}
+
+if (require.main === module) {
+  let options: MigrateOptions;
+  try {
+    options = parseArgs(process.argv.slice(2));
+  } catch (error: any) {
+    console.error(error.message);
+    process.exit(2);
+  }
+  migrate(options)
+    .then(ok => process.exit(ok ? 0 : 1))
+    .catch(error => {
+      console.error('Migration failed:', error);
+      process.exit(1);
+    });
+}
+
+export { migrate, parseArgs };
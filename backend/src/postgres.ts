@@ -2,6 +2,7 @@ import { Pool, PoolClient } from 'pg';
 import bcrypt from 'bcryptjs';
 import jwt from 'jsonwebtoken';
 import crypto from 'crypto';
+import { SegmentSourceRow, StoredSegments } from './segments';
 
 // Database connection
 const pool = new Pool({
@@ -49,6 +50,14 @@ export interface LocationRecord {
   created_at: string;
 }
 
+export interface ViewportLocation {
+  deviceId: string;
+  latitude: number;
+  longitude: number;
+  count: number;
+  timestamp: string;
+}
+
 export interface DeviceCode {
   id: string;
   code: string;
@@ -65,6 +74,17 @@ export interface DeviceTokenRecord {
   revoked_at?: string;
 }
 
+// Row shape of the legacy SQLite `locations` table (see database.ts)
+export interface LegacyLocationRow {
+  id?: number;
+  deviceId: string;
+  latitude: number;
+  longitude: number;
+  timestamp: string;
+}
+
+const MIGRATION_CHUNK_SIZE = 1000;
+
 export class PostgresDatabase {
   private pool: Pool;
 
@@ -436,6 +456,137 @@ export class PostgresDatabase {
     }
   }
 
+  // History inside a bounding box and time range, merged into grid cells of
+  // the given size (degrees) so zoomed-out views receive a bounded number of
+  // points. Without a cell size every fix is returned as is.
+  async getViewportLocations(
+    userId: string,
+    bounds: { south: number; west: number; north: number; east: number },
+    cell: { lat: number; lng: number } | null,
+    range: { since: string; until?: string },
+    deviceId?: string,
+    limit: number = 20000
+  ): Promise<ViewportLocation[]> {
+    const client = await this.connect();
+    try {
+      const filters = `user_id = $1
+           AND ($2::text IS NULL OR device_id = $2::text)
+           AND latitude BETWEEN $3 AND $4
+           AND longitude BETWEEN $5 AND $6
+           AND timestamp >= $7::timestamptz
+           AND ($8::timestamptz IS NULL OR timestamp <= $8::timestamptz)`;
+      const params = [userId, deviceId || null, bounds.south, bounds.north, bounds.west, bounds.east,
+        range.since, range.until || null];
+
+      if (!cell) {
+        const result = await client.query(
+          `SELECT device_id AS "deviceId",
+                  latitude::float8 AS latitude,
+                  longitude::float8 AS longitude,
+                  1 AS count,
+                  timestamp
+           FROM locations
+           WHERE ${filters}
+           ORDER BY timestamp DESC
+           LIMIT $9`,
+          [...params, limit]
+        );
+        return result.rows;
+      }
+
+      const result = await client.query(
+        `SELECT device_id AS "deviceId",
+                AVG(latitude)::float8 AS latitude,
+                AVG(longitude)::float8 AS longitude,
+                COUNT(*)::int AS count,
+                MAX(timestamp) AS timestamp
+         FROM locations
+         WHERE ${filters}
+         GROUP BY device_id, FLOOR(latitude / $9::numeric), FLOOR(longitude / $10::numeric)
+         ORDER BY MAX(timestamp) DESC
+         LIMIT $11`,
+        [...params, cell.lat, cell.lng, limit]
+      );
+      return result.rows;
+    } finally {
+      client.release();
+    }
+  }
+
+  // Oldest-first fixes newer than `since`, used to (re)build incremental consumers
+  async getLocationsSince(userId: string, deviceId: string, since: string | null, limit: number = 5000): Promise<SegmentSourceRow[]> {
+    const client = await this.connect();
+    try {
+      const result = await client.query(
+        `SELECT id, latitude, longitude, timestamp, created_at, created_at::text AS created_key
+         FROM locations
+         WHERE user_id = $1 AND device_id = $2
+           AND ($3::timestamptz IS NULL OR timestamp > $3::timestamptz)
+         ORDER BY timestamp ASC
+         LIMIT $4`,
+        [userId, deviceId, since, limit]
+      );
+      return result.rows;
+    } finally {
+      client.release();
+    }
+  }
+
+  // Fixes in insertion order after a (created_at, id) keyset position. Unlike
+  // the fix timestamp this also surfaces backfilled fixes.
+  async getLocationsCreatedAfter(
+    userId: string,
+    deviceId: string,
+    after: { createdKey: string; id: string } | null,
+    limit: number = 5000
+  ): Promise<SegmentSourceRow[]> {
+    const client = await this.connect();
+    try {
+      const result = await client.query(
+        `SELECT id, latitude, longitude, timestamp, created_at, created_at::text AS created_key
+         FROM locations
+         WHERE user_id = $1 AND device_id = $2
+           AND ($3::timestamptz IS NULL OR (created_at, id) > ($3::timestamptz, $4::uuid))
+         ORDER BY created_at ASC, id ASC
+         LIMIT $5`,
+        [userId, deviceId, after?.createdKey ?? null, after?.id ?? null, limit]
+      );
+      return result.rows;
+    } finally {
+      client.release();
+    }
+  }
+
+  // Persisted stay/trip segmentation state (see segments.ts)
+  async loadSegmentState(userId: string, deviceId: string): Promise<StoredSegments | null> {
+    const client = await this.connect();
+    try {
+      const result = await client.query(
+        `SELECT state FROM segment_state WHERE user_id = $1 AND device_id = $2`,
+        [userId, deviceId]
+      );
+      return result.rows.length > 0 ? result.rows[0].state : null;
+    } finally {
+      client.release();
+    }
+  }
+
+  async saveSegmentState(userId: string, deviceId: string, state: StoredSegments): Promise<void> {
+    const client = await this.connect();
+    try {
+      await client.query(
+        `INSERT INTO segment_state (user_id, device_id, state, updated_at)
+         VALUES ($1, $2, $3, CURRENT_TIMESTAMP)
+         ON CONFLICT (user_id, device_id) DO UPDATE SET
+           state = EXCLUDED.state,
+           updated_at = CURRENT_TIMESTAMP`,
+        [userId, deviceId, JSON.stringify(state)]
+      );
+    } finally {
+      client.release();
+    }
+  }
+
   // Utility functions
   async cleanupExpiredCodes(): Promise<number> {
     const client = await this.connect();
@@ -492,27 +643,112 @@ export class PostgresDatabase {
   }
 
   // Migration helpers
-  async migrateFromSQLite(sqliteLocations: any[]): Promise<void> {
-    const client = await this.connect();
+  async migrateFromSQLite(sqliteLocations: LegacyLocationRow[]): Promise<void> {
     const demoUserId = '00000000-0000-0000-0000-000000000000';
-    
+    for (let i = 0; i < sqliteLocations.length; i += MIGRATION_CHUNK_SIZE) {
+      await this.migrateLocationChunk(demoUserId, sqliteLocations.slice(i, i + MIGRATION_CHUNK_SIZE));
+    }
+  }
+
+  async ensureMigrationCheckpoints(): Promise<void> {
+    const client = await this.connect();
+    try {
+      await client.query(
+        `CREATE TABLE IF NOT EXISTS migration_checkpoints (
+           source VARCHAR(512) PRIMARY KEY,
+           last_id BIGINT NOT NULL DEFAULT 0,
+           rows_copied BIGINT NOT NULL DEFAULT 0,
+           updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+         )`
+      );
+    } finally {
+      client.release();
+    }
+  }
+
+  async getMigrationCheckpoint(source: string): Promise<{ last_id: number; rows_copied: number } | null> {
+    const client = await this.connect();
+    try {
+      const result = await client.query(
+        `SELECT last_id, rows_copied FROM migration_checkpoints WHERE source = $1`,
+        [source]
+      );
+      if (result.rows.length === 0) return null;
+      return {
+        last_id: parseInt(result.rows[0].last_id),
+        rows_copied: parseInt(result.rows[0].rows_copied)
+      };
+    } finally {
+      client.release();
+    }
+  }
+
+  async resetMigrationCheckpoint(source: string): Promise<void> {
+    const client = await this.connect();
+    try {
+      await client.query(`DELETE FROM migration_checkpoints WHERE source = $1`, [source]);
+    } finally {
+      client.release();
+    }
+  }
+
+  // Write one chunk of legacy rows in its own transaction using multi-row
+  // inserts. When a checkpoint is given it is advanced in the same
+  // transaction, so a resumed run never re-reads a committed chunk.
+  async migrateLocationChunk(
+    userId: string,
+    rows: LegacyLocationRow[],
+    checkpoint?: { source: string; lastId: number }
+  ): Promise<number> {
+    if (rows.length === 0) return 0;
+
+    const lastSeen = new Map<string, string>();
+    for (const row of rows) {
+      const prev = lastSeen.get(row.deviceId);
+      if (!prev || row.timestamp > prev) lastSeen.set(row.deviceId, row.timestamp);
+    }
+
+    const client = await this.connect();
     try {
       await client.query('BEGIN');
 
-      for (const loc of sqliteLocations) {
-        // Register device for demo user
-        await this.registerDevice(demoUserId, loc.deviceId, `Device ${loc.deviceId.substring(0, 8)}`);
-        
-        // Add location
+      await client.query(
+        `INSERT INTO devices (device_id, user_id, name, last_seen)
+         SELECT d, $1, 'Device ' || LEFT(d, 8), ls
+         FROM unnest($2::text[], $3::timestamptz[]) AS t(d, ls)
+         ON CONFLICT (device_id, user_id)
+         DO UPDATE SET last_seen = GREATEST(devices.last_seen, EXCLUDED.last_seen)`,
+        [userId, Array.from(lastSeen.keys()), Array.from(lastSeen.values())]
+      );
+
+      const result = await client.query(
+        `INSERT INTO locations (device_id, user_id, latitude, longitude, timestamp)
+         SELECT d, $1, lat, lon, ts
+         FROM unnest($2::text[], $3::float8[], $4::float8[], $5::timestamptz[]) AS t(d, lat, lon, ts)
+         ON CONFLICT (device_id, user_id, timestamp) DO NOTHING`,
+        [
+          userId,
+          rows.map(r => r.deviceId),
+          rows.map(r => r.latitude),
+          rows.map(r => r.longitude),
+          rows.map(r => r.timestamp)
+        ]
+      );
+
+      if (checkpoint) {
         await client.query(
-          `INSERT INTO locations (device_id, user_id, latitude, longitude, timestamp)
-           VALUES ($1, $2, $3, $4, $5)
-           ON CONFLICT (device_id, user_id, timestamp) DO NOTHING`,
-          [loc.deviceId, demoUserId, loc.latitude, loc.longitude, loc.timestamp]
+          `INSERT INTO migration_checkpoints (source, last_id, rows_copied, updated_at)
+           VALUES ($1, $2, $3, CURRENT_TIMESTAMP)
+           ON CONFLICT (source) DO UPDATE SET
+             last_id = EXCLUDED.last_id,
+             rows_copied = migration_checkpoints.rows_copied + EXCLUDED.rows_copied,
+             updated_at = CURRENT_TIMESTAMP`,
+          [checkpoint.source, checkpoint.lastId, rows.length]
         );
       }
 
       await client.query('COMMIT');
+      return result.rowCount ?? 0;
     } catch (error) {
       await client.query('ROLLBACK');
       throw error;
@@ -520,6 +756,28 @@ export class PostgresDatabase {
       client.release();
     }
   }
+
+  // Number of distinct (device, timestamp) keys among the given legacy rows
+  // that have no matching location in PostgreSQL
+  async countMissingLocations(userId: string, rows: LegacyLocationRow[]): Promise<number> {
+    if (rows.length === 0) return 0;
+    const client = await this.connect();
+    try {
+      const result = await client.query(
+        `SELECT COUNT(*) AS missing
+         FROM (SELECT DISTINCT d, ts FROM unnest($2::text[], $3::timestamptz[]) AS t(d, ts)) k
+         WHERE NOT EXISTS (
+           SELECT 1 FROM locations l
+           WHERE l.user_id = $1 AND l.device_id = k.d AND l.timestamp = k.ts
+         )`,
+        [userId, rows.map(r => r.deviceId), rows.map(r => r.timestamp)]
+      );
+      return parseInt(result.rows[0].missing);
+    } finally {
+      client.release();
+    }
+  }
+
 }
 
 // JWT utilities
@@ -0,0 +1,325 @@
+import {
+  DeviceSegmenter,
+  SegmentPoint,
+  SegmentSource,
+  SegmentSourceRow,
+  SegmentStore,
+  StoredSegments,
+} from './segments';
+
+const BASE = Date.parse('2024-05-01T08:00:00Z');
+const HOME = { latitude: 52.37, longitude: 4.89 };
+const WORK = { latitude: 52.36, longitude: 4.95 }; // ~4 km east
+
+const fix = (minute: number, at: { latitude: number; longitude: number }): SegmentPoint => ({
+  ...at,
+  timestamp: new Date(BASE + minute * 60 * 1000).toISOString(),
+});
+
+// Fixes every minute at one place
+const dwell = (from: number, to: number, at: { latitude: number; longitude: number }) => {
+  const points: SegmentPoint[] = [];
+  for (let m = from; m <= to; m++) points.push(fix(m, at));
+  return points;
+};
+
+// Fixes every minute along the straight line between two places
+const travel = (from: number, to: number, a: typeof HOME, b: typeof HOME) => {
+  const points: SegmentPoint[] = [];
+  for (let m = from; m <= to; m++) {
+    const f = (m - from + 1) / (to - from + 2);
+    points.push(fix(m, {
+      latitude: a.latitude + (b.latitude - a.latitude) * f,
+      longitude: a.longitude + (b.longitude - a.longitude) * f,
+    }));
+  }
+  return points;
+};
+
+const commute = () => [
+  ...dwell(0, 20, HOME),
+  ...travel(21, 30, HOME, WORK),
+  ...dwell(31, 60, WORK),
+];
+
+const batch = (points: SegmentPoint[]) => {
+  const segmenter = new DeviceSegmenter('cat');
+  segmenter.push(points);
+  return segmenter.segments();
+};
+
+describe('DeviceSegmenter', () => {
+  it('splits stay -> trip -> stay', () => {
+    const segments = batch(commute());
+
+    expect(segments.map(s => [s.type, s.ongoing])).toEqual([
+      ['stay', false],
+      ['trip', false],
+      ['stay', true],
+    ]);
+    const [home, trip, work] = segments;
+    expect(home.start).toBe(fix(0, HOME).timestamp);
+    expect(home.end).toBe(fix(20, HOME).timestamp);
+    expect(home.pointCount).toBe(21);
+    expect(trip.start).toBe(home.end);
+    expect(trip.end).toBe(work.start);
+    expect(trip.type === 'trip' && trip.distance).toBeGreaterThan(3500);
+    expect(work.pointCount).toBe(30);
+  });
+
+  it('reports a cluster too short to be a stay as an ongoing trip', () => {
+    const segments = batch(dwell(0, 5, HOME));
+
+    expect(segments).toHaveLength(1);
+    expect(segments[0]).toMatchObject({ type: 'trip', ongoing: true, pointCount: 6 });
+    expect(segments[0].start).toBe(fix(0, HOME).timestamp);
+    expect(segments[0].end).toBe(fix(5, HOME).timestamp);
+  });
+
+  it('keeps the fixes of a short stop in the trip around it', () => {
+    const points = [
+      ...dwell(0, 20, HOME),
+      ...travel(21, 25, HOME, WORK),
+      ...dwell(26, 29, WORK), // leaves again before minStayMinutes
+      ...travel(30, 34, WORK, HOME),
+      ...dwell(35, 60, HOME),
+    ];
+    const segments = batch(points);
+
+    expect(segments.map(s => s.type)).toEqual(['stay', 'trip', 'stay']);
+    const total = segments.reduce((sum, s) => sum + s.pointCount, 0);
+    // Every fix is counted once, plus the trip's entry fix shared with the stay after it
+    expect(total).toBe(points.length + 1);
+  });
+
+  it('gives the same segments for incremental and batch pushes', () => {
+    const points = commute();
+    const incremental = new DeviceSegmenter('cat');
+    for (let i = 0; i < points.length; i += 7) {
+      incremental.push(points.slice(i, i + 7));
+      // Intermediate reads must not disturb the state
+      incremental.segments();
+    }
+
+    expect(incremental.segments()).toEqual(batch(points));
+  });
+
+  it('resumes from serialized state', () => {
+    const points = commute();
+    const first = new DeviceSegmenter('cat');
+    first.push(points.slice(0, 40));
+    const resumed = DeviceSegmenter.fromState('cat', JSON.parse(JSON.stringify(first.toState())));
+    resumed.push(points.slice(40));
+
+    expect(resumed.segments()).toEqual(batch(points));
+  });
+
+  it('keeps a stay open through a single outlier', () => {
+    const points = dwell(0, 30, HOME);
+    points[15] = fix(15, { latitude: HOME.latitude + 0.003, longitude: HOME.longitude }); // ~330 m north
+    const segments = batch(points);
+
+    expect(segments).toHaveLength(1);
+    expect(segments[0]).toMatchObject({ type: 'stay', ongoing: true, pointCount: 31, radius: 0 });
+    expect(segments[0].start).toBe(fix(0, HOME).timestamp);
+    expect(segments[0].end).toBe(fix(30, HOME).timestamp);
+  });
+
+  it('ends a stay once enough time is spent outside it', () => {
+    // Sparse fixes: two outside, five minutes apart, are enough
+    const points = [...dwell(0, 20, HOME), fix(30, WORK), fix(35, WORK)];
+    const segments = batch(points);
+
+    expect(segments.map(s => [s.type, s.ongoing])).toEqual([['stay', false], ['trip', true]]);
+    expect(segments[0].end).toBe(fix(20, HOME).timestamp);
+  });
+
+  it('ignores fixes at or before the newest one consumed', () => {
+    const points = commute();
+    const segmenter = new DeviceSegmenter('cat');
+    segmenter.push(points);
+
+    expect(segmenter.push([fix(10, WORK), fix(60, WORK)])).toBe(0);
+    expect(segmenter.segments()).toEqual(batch(points));
+  });
+});
+
+// In-memory stand-in for the locations table and segment_state
+class MemorySource implements SegmentSource {
+  rows: SegmentSourceRow[] = [];
+  states = new Map<string, StoredSegments>();
+  saves = 0;
+  private clock = Date.parse('2024-06-01T00:00:00Z');
+
+  insert(points: SegmentPoint[]): void {
+    for (const p of points) {
+      const createdAt = new Date(this.clock++).toISOString();
+      this.rows.push({
+        ...p,
+        id: `00000000-0000-0000-0000-${String(this.rows.length).padStart(12, '0')}`,
+        created_at: createdAt,
+        created_key: createdAt,
+      });
+    }
+  }
+
+  async loadSegmentState(userId: string, deviceId: string) {
+    const state = this.states.get(`${userId}:${deviceId}`);
+    return state ? JSON.parse(JSON.stringify(state)) : null;
+  }
+
+  async saveSegmentState(userId: string, deviceId: string, state: StoredSegments) {
+    this.saves++;
+    this.states.set(`${userId}:${deviceId}`, JSON.parse(JSON.stringify(state)));
+  }
+
+  async getLocationsSince(userId: string, deviceId: string, since: string | null, limit: number) {
+    return this.rows
+      .filter(r => since === null || Date.parse(r.timestamp as string) > Date.parse(since))
+      .sort((a, b) => Date.parse(a.timestamp as string) - Date.parse(b.timestamp as string))
+      .slice(0, limit);
+  }
+
+  async getLocationsCreatedAfter(
+    userId: string,
+    deviceId: string,
+    after: { createdKey: string; id: string } | null,
+    limit: number
+  ) {
+    const key = (r: SegmentSourceRow) => `${r.created_key}|${r.id}`;
+    return this.rows
+      .filter(r => after === null || key(r) > `${after.createdKey}|${after.id}`)
+      .sort((a, b) => key(a).localeCompare(key(b)))
+      .slice(0, limit);
+  }
+}
+
+describe('SegmentStore', () => {
+  it('folds new fixes in and matches a batch pass', async () => {
+    const source = new MemorySource();
+    const store = new SegmentStore(source);
+    const points = commute();
+
+    source.insert(points.slice(0, 25));
+    await store.getSegments('u', 'cat');
+    for (const p of points.slice(25)) {
+      source.insert([p]);
+      await store.ingest('u', 'cat');
+    }
+
+    expect(await store.getSegments('u', 'cat')).toEqual(batch(points));
+  });
+
+  it('rebuilds when a backfilled fix arrives out of order', async () => {
+    const source = new MemorySource();
+    const store = new SegmentStore(source);
+    const points = commute();
+    const late = points.splice(25, 3); // part of the trip, delivered last
+
+    source.insert(points);
+    expect(await store.getSegments('u', 'cat')).toEqual(batch(points));
+
+    source.insert(late);
+    await store.ingest('u', 'cat');
+
+    expect(await store.getSegments('u', 'cat')).toEqual(batch(commute()));
+  });
+
+  it('resumes a backfill from the last stay closed before it', async () => {
+    const source = new MemorySource();
+    const store = new SegmentStore(source);
+    const points = [
+      ...commute(),
+      ...travel(61, 70, WORK, HOME),
+      ...dwell(71, 100, HOME),
+    ];
+    const late = points.splice(85, 1); // inside the second stay at home
+
+    source.insert(points);
+    await store.getSegments('u', 'cat');
+    source.insert(late);
+    const scan = jest.spyOn(source, 'getLocationsSince');
+
+    expect(await store.getSegments('u', 'cat')).toEqual(batch([...points, ...late].sort(
+      (a, b) => Date.parse(a.timestamp as string) - Date.parse(b.timestamp as string)
+    )));
+    // Rescanned from the end of the stay at work, not from the first fix
+    expect(scan.mock.calls[0][2]).toBe(fix(60, WORK).timestamp);
+  });
+
+  it('coalesces backfill rebuilds while ingesting', async () => {
+    jest.useFakeTimers();
+    try {
+      const source = new MemorySource();
+      const store = new SegmentStore(source, {}, 1000, 1000);
+      const points = commute();
+      const late = points.splice(0, 20); // an import of older history
+
+      source.insert(points);
+      await store.getSegments('u', 'cat');
+      const scan = jest.spyOn(source, 'getLocationsSince');
+      for (let i = 0; i < late.length; i += 5) {
+        source.insert(late.slice(i, i + 5));
+        await store.ingest('u', 'cat');
+      }
+      expect(scan).not.toHaveBeenCalled();
+
+      jest.advanceTimersByTime(1000);
+      expect(await store.getSegments('u', 'cat')).toEqual(batch(commute()));
+      expect(scan).toHaveBeenCalledTimes(1);
+    } finally {
+      jest.useRealTimers();
+    }
+  });
+
+  it('resumes from persisted state after a restart', async () => {
+    const source = new MemorySource();
+    const points = commute();
+    source.insert(points.slice(0, 40));
+    await new SegmentStore(source).getSegments('u', 'cat');
+
+    source.insert(points.slice(40));
+    const restarted = new SegmentStore(source);
+    const scan = jest.spyOn(source, 'getLocationsSince');
+
+    expect(await restarted.getSegments('u', 'cat')).toEqual(batch(points));
+    expect(scan).not.toHaveBeenCalled();
+  });
+
+  it('does not cache or persist devices without fixes', async () => {
+    const source = new MemorySource();
+    const store = new SegmentStore(source);
+
+    expect(await store.getSegments('u', 'nobody')).toEqual([]);
+    expect(source.saves).toBe(0);
+    expect(source.states.size).toBe(0);
+  });
+
+  it('keeps at most maxDevices segmenters in memory', async () => {
+    const source = new MemorySource();
+    const store = new SegmentStore(source, {}, 2);
+    source.insert(dwell(0, 20, HOME));
+
+    for (const device of ['a', 'b', 'c']) {
+      await store.getSegments('u', device);
+    }
+    const load = jest.spyOn(source, 'loadSegmentState');
+    await store.getSegments('u', 'c');
+    expect(load).not.toHaveBeenCalled();
+    await store.getSegments('u', 'a');
+    expect(load).toHaveBeenCalledTimes(1);
+  });
+
+  it('runs one refresh at a time per device', async () => {
+    const source = new MemorySource();
+    const store = new SegmentStore(source);
+    const points = commute();
+    source.insert(points.slice(0, 30));
+
+    const first = store.ingest('u', 'cat');
+    source.insert(points.slice(30));
+    await Promise.all([first, store.ingest('u', 'cat'), store.ingest('u', 'cat')]);
+
+    expect(await store.getSegments('u', 'cat')).toEqual(batch(points));
+  });
+});
@@ -0,0 +1,681 @@
+// Stay/trip segmentation over a device's location history.
+//
+// Fixes are consumed strictly in timestamp order and folded into a small
+// amount of per-device state, so new fixes extend the existing segments
+// instead of re-scanning the whole history. The state is persisted, so a
+// restart resumes where it left off.
+
+export interface SegmentPoint {
+  latitude: number;
+  longitude: number;
+  timestamp: string | Date;
+}
+
+export interface StaySegment {
+  type: 'stay';
+  deviceId: string;
+  latitude: number;   // centroid
+  longitude: number;  // centroid
+  radius: number;     // meters, max distance of a member fix from the centroid
+  start: string;      // entry time
+  end: string;        // exit time (last fix seen inside the stay)
+  pointCount: number;
+  ongoing: boolean;
+}
+
+export interface TripSegment {
+  type: 'trip';
+  deviceId: string;
+  start: string;
+  end: string;
+  distance: number;   // meters, summed between consecutive fixes
+  pointCount: number;
+  ongoing: boolean;
+}
+
+export type Segment = StaySegment | TripSegment;
+
+export interface SegmenterOptions {
+  stayRadius: number;     // meters a fix may be from the centroid to join a stay
+  minStayMinutes: number; // dwell time before a cluster counts as a stay
+  exitFixes: number;      // consecutive fixes outside a stay that end it...
+  exitMinutes: number;    // ...or time spent outside it, whichever comes first
+  maxSegments: number;    // closed segments kept per device (oldest dropped)
+}
+
+const DEFAULT_OPTIONS: SegmenterOptions = {
+  stayRadius: 100,
+  minStayMinutes: 10,
+  exitFixes: 3,
+  exitMinutes: 5,
+  maxSegments: 500,
+};
+
+const SEGMENT_PAGE_SIZE = 5000;
+const REBUILD_DELAY_MS = 30 * 1000;
+
+const EARTH_RADIUS_M = 6371000;
+const DEG = Math.PI / 180;
+
+export function haversine(lat1: number, lon1: number, lat2: number, lon2: number): number {
+  const dLat = (lat2 - lat1) * DEG;
+  const dLon = (lon2 - lon1) * DEG;
+  const a = Math.sin(dLat / 2) ** 2 +
+            Math.cos(lat1 * DEG) * Math.cos(lat2 * DEG) * Math.sin(dLon / 2) ** 2;
+  return 2 * EARTH_RADIUS_M * Math.asin(Math.min(1, Math.sqrt(a)));
+}
+
+// Distances from one point to the first `n` entries of the coordinate arrays,
+// computed in a single pass over the typed arrays.
+function distancesTo(lat: number, lon: number, lats: Float64Array, lons: Float64Array, n: number, out: Float64Array): void {
+  const cosLat = Math.cos(lat * DEG);
+  for (let i = 0; i < n; i++) {
+    const dLat = (lats[i] - lat) * DEG;
+    const dLon = (lons[i] - lon) * DEG;
+    const s1 = Math.sin(dLat / 2);
+    const s2 = Math.sin(dLon / 2);
+    const a = s1 * s1 + cosLat * Math.cos(lats[i] * DEG) * s2 * s2;
+    out[i] = 2 * EARTH_RADIUS_M * Math.asin(Math.min(1, Math.sqrt(a)));
+  }
+}
+
+// Growable columnar buffer for a short run of fixes.
+class PointBuffer {
+  lats = new Float64Array(64);
+  lons = new Float64Array(64);
+  times = new Float64Array(64);
+  length = 0;
+
+  static fromState(points: Array<[number, number, number]>): PointBuffer {
+    const buffer = new PointBuffer();
+    for (const [lat, lon, t] of points) {
+      buffer.push(lat, lon, t);
+    }
+    return buffer;
+  }
+
+  toState(): Array<[number, number, number]> {
+    const points: Array<[number, number, number]> = [];
+    for (let i = 0; i < this.length; i++) {
+      points.push([this.lats[i], this.lons[i], this.times[i]]);
+    }
+    return points;
+  }
+
+  push(lat: number, lon: number, t: number): void {
+    if (this.length === this.lats.length) {
+      const grow = (src: Float64Array) => {
+        const dst = new Float64Array(src.length * 2);
+        dst.set(src);
+        return dst;
+      };
+      this.lats = grow(this.lats);
+      this.lons = grow(this.lons);
+      this.times = grow(this.times);
+    }
+    this.lats[this.length] = lat;
+    this.lons[this.length] = lon;
+    this.times[this.length] = t;
+    this.length++;
+  }
+
+  clear(): void {
+    this.length = 0;
+  }
+}
+
+export interface TripState {
+  start: number;
+  end: number;
+  distance: number;
+  pointCount: number;
+  lastLat: number;
+  lastLon: number;
+}
+
+// Running aggregates of a confirmed stay; its fixes are not kept
+export interface StayState {
+  count: number;    // fixes inside the radius
+  sumLat: number;
+  sumLon: number;
+  start: number;
+  end: number;      // last fix inside
+  radius: number;   // max distance of a fix from the centroid when it arrived
+  lastLat: number;
+  lastLon: number;
+  outliers: number; // fixes outside the radius that didn't turn into an exit
+}
+
+// Where a stay was closed. Fixes after `confirmed` can't change anything
+// before it, so a backfill that late resumes here instead of from scratch.
+export interface SegmentBoundary {
+  closed: number;    // closed segments up to and including the stay
+  end: number;       // the stay's last fix
+  confirmed: number; // the fix that confirmed the exit
+  lat: number;       // position of the stay's last fix
+  lon: number;
+}
+
+// Everything a segmenter needs to resume, in a JSON-safe shape
+export interface SegmenterState {
+  closed: Segment[];
+  window: Array<[number, number, number]>;  // [latitude, longitude, time ms] of a cluster not yet a stay
+  stay: StayState | null;
+  outside: Array<[number, number, number]>; // fixes outside the stay, exit not yet confirmed
+  trip: TripState | null;
+  lastTime: number | null;
+  boundaries: SegmentBoundary[];
+}
+
+function extendTrip(trip: TripState | null, lat: number, lon: number, t: number): TripState {
+  if (!trip) {
+    return { start: t, end: t, distance: 0, pointCount: 1, lastLat: lat, lastLon: lon };
+  }
+  trip.distance += haversine(trip.lastLat, trip.lastLon, lat, lon);
+  trip.end = t;
+  trip.pointCount++;
+  trip.lastLat = lat;
+  trip.lastLon = lon;
+  return trip;
+}
+
+export class DeviceSegmenter {
+  private readonly options: SegmenterOptions;
+  private readonly closed: Segment[] = [];
+  private boundaries: SegmentBoundary[] = [];
+  private window = new PointBuffer();
+  private scratch = new Float64Array(64);
+  private sumLat = 0;
+  private sumLon = 0;
+  private stay: StayState | null = null;
+  private outside = new PointBuffer();
+  private trip: TripState | null = null;
+  private lastTime = -Infinity;
+
+  constructor(readonly deviceId: string, options: Partial<SegmenterOptions> = {}) {
+    this.options = { ...DEFAULT_OPTIONS, ...options };
+  }
+
+  static fromState(deviceId: string, state: SegmenterState, options: Partial<SegmenterOptions> = {}): DeviceSegmenter {
+    const segmenter = new DeviceSegmenter(deviceId, options);
+    segmenter.closed.push(...state.closed);
+    segmenter.boundaries = state.boundaries.map(b => ({ ...b }));
+    segmenter.window = PointBuffer.fromState(state.window);
+    for (const [lat, lon] of state.window) {
+      segmenter.sumLat += lat;
+      segmenter.sumLon += lon;
+    }
+    segmenter.stay = state.stay ? { ...state.stay } : null;
+    segmenter.outside = PointBuffer.fromState(state.outside);
+    segmenter.trip = state.trip ? { ...state.trip } : null;
+    segmenter.lastTime = state.lastTime ?? -Infinity;
+    return segmenter;
+  }
+
+  toState(): SegmenterState {
+    return {
+      closed: this.closed.slice(),
+      window: this.window.toState(),
+      stay: this.stay ? { ...this.stay } : null,
+      outside: this.outside.toState(),
+      trip: this.trip ? { ...this.trip } : null,
+      lastTime: Number.isFinite(this.lastTime) ? this.lastTime : null,
+      boundaries: this.boundaries.map(b => ({ ...b })),
+    };
+  }
+
+  // Timestamp of the newest fix consumed, or null if none yet.
+  get lastTimestamp(): string | null {
+    return Number.isFinite(this.lastTime) ? new Date(this.lastTime).toISOString() : null;
+  }
+
+  // A segmenter rewound to the newest stay closure a fix at `t` can't
+  // affect, ready to be fed every fix after that stay's end. Null if there
+  // is none and only a full rebuild will do.
+  rewind(t: number): DeviceSegmenter | null {
+    let i = this.boundaries.length - 1;
+    while (i >= 0 && this.boundaries[i].confirmed >= t) i--;
+    if (i < 0) return null;
+
+    const b = this.boundaries[i];
+    const segmenter = new DeviceSegmenter(this.deviceId, this.options);
+    segmenter.closed.push(...this.closed.slice(0, b.closed));
+    segmenter.boundaries = this.boundaries.slice(0, i + 1).map(x => ({ ...x }));
+    segmenter.trip = { start: b.end, end: b.end, distance: 0, pointCount: 0, lastLat: b.lat, lastLon: b.lon };
+    segmenter.lastTime = b.end;
+    return segmenter;
+  }
+
+  // Feed fixes in ascending timestamp order. Fixes at or before the last
+  // consumed timestamp are ignored (SegmentStore rebuilds instead of pushing
+  // them). Returns the number of fixes consumed.
+  push(points: SegmentPoint[]): number {
+    let consumed = 0;
+    for (const p of points) {
+      const t = new Date(p.timestamp).getTime();
+      const lat = Number(p.latitude);
+      const lon = Number(p.longitude);
+      if (!Number.isFinite(t) || !Number.isFinite(lat) || !Number.isFinite(lon) || t <= this.lastTime) {
+        continue;
+      }
+      this.add(lat, lon, t);
+      this.lastTime = t;
+      consumed++;
+    }
+    return consumed;
+  }
+
+  // Closed segments followed by the in-progress one(s), oldest first. Fixes
+  // of a cluster that hasn't dwelled long enough to be a stay are reported
+  // as part of the ongoing trip; fixes of an unconfirmed exit as part of the
+  // ongoing stay.
+  segments(): Segment[] {
+    const result = this.closed.slice();
+    const w = this.window;
+    let trip = this.trip ? { ...this.trip } : null;
+    for (let i = 0; i < w.length; i++) {
+      trip = extendTrip(trip, w.lats[i], w.lons[i], w.times[i]);
+    }
+    if (trip) {
+      result.push(this.tripSegment(trip, true));
+    }
+    if (this.stay) {
+      result.push(this.staySegment(this.stay, true));
+    }
+    return result;
+  }
+
+  private add(lat: number, lon: number, t: number): void {
+    if (this.stay) {
+      this.addToStay(this.stay, lat, lon, t);
+      return;
+    }
+
+    const w = this.window;
+    if (w.length > 0 && haversine(this.sumLat / w.length, this.sumLon / w.length, lat, lon) > this.options.stayRadius) {
+      // The window can't absorb the next fix: its fixes belong to the trip
+      for (let i = 0; i < w.length; i++) {
+        this.trip = extendTrip(this.trip, w.lats[i], w.lons[i], w.times[i]);
+      }
+      this.clearWindow();
+    }
+
+    w.push(lat, lon, t);
+    this.sumLat += lat;
+    this.sumLon += lon;
+
+    if (t - w.times[0] >= this.options.minStayMinutes * 60 * 1000) {
+      // Window has dwelled long enough: the trip leading into it ends at entry.
+      if (this.trip) {
+        extendTrip(this.trip, w.lats[0], w.lons[0], w.times[0]);
+        this.close(this.tripSegment(this.trip, false));
+        this.trip = null;
+      }
+      const cLat = this.sumLat / w.length;
+      const cLon = this.sumLon / w.length;
+      if (this.scratch.length < w.length) {
+        this.scratch = new Float64Array(w.lats.length);
+      }
+      distancesTo(cLat, cLon, w.lats, w.lons, w.length, this.scratch);
+      let radius = 0;
+      for (let i = 0; i < w.length; i++) {
+        if (this.scratch[i] > radius) radius = this.scratch[i];
+      }
+      this.stay = {
+        count: w.length, sumLat: this.sumLat, sumLon: this.sumLon,
+        start: w.times[0], end: t, radius, lastLat: lat, lastLon: lon, outliers: 0,
+      };
+      this.clearWindow();
+    }
+  }
+
+  // A stay only ends once the device has stayed out of it, so a single
+  // stray fix doesn't split it in two.
+  private addToStay(stay: StayState, lat: number, lon: number, t: number): void {
+    const o = this.outside;
+    if (haversine(stay.sumLat / stay.count, stay.sumLon / stay.count, lat, lon) <= this.options.stayRadius) {
+      stay.outliers += o.length;
+      o.clear();
+      stay.count++;
+      stay.sumLat += lat;
+      stay.sumLon += lon;
+      stay.end = t;
+      stay.lastLat = lat;
+      stay.lastLon = lon;
+      stay.radius = Math.max(stay.radius, haversine(stay.sumLat / stay.count, stay.sumLon / stay.count, lat, lon));
+      return;
+    }
+
+    o.push(lat, lon, t);
+    if (o.length < this.options.exitFixes && t - o.times[0] < this.options.exitMinutes * 60 * 1000) {
+      return;
+    }
+
+    // Exit confirmed: close the stay at its last fix inside and start the
+    // trip there, then replay the fixes outside it
+    this.close(this.staySegment(stay, false));
+    this.boundaries.push({ closed: this.closed.length, end: stay.end, confirmed: t, lat: stay.lastLat, lon: stay.lastLon });
+    this.trip = { start: stay.end, end: stay.end, distance: 0, pointCount: 0, lastLat: stay.lastLat, lastLon: stay.lastLon };
+    this.stay = null;
+    const pending = o.toState();
+    o.clear();
+    for (const [pLat, pLon, pt] of pending) {
+      this.add(pLat, pLon, pt);
+    }
+  }
+
+  private clearWindow(): void {
+    this.window.clear();
+    this.sumLat = 0;
+    this.sumLon = 0;
+  }
+
+  private close(segment: Segment): void {
+    this.closed.push(segment);
+    const excess = this.closed.length - this.options.maxSegments;
+    if (excess > 0) {
+      this.closed.splice(0, excess);
+      this.boundaries = this.boundaries
+        .map(b => ({ ...b, closed: b.closed - excess }))
+        .filter(b => b.closed >= 0);
+    }
+  }
+
+  private staySegment(stay: StayState, ongoing: boolean): StaySegment {
+    return {
+      type: 'stay',
+      deviceId: this.deviceId,
+      latitude: stay.sumLat / stay.count,
+      longitude: stay.sumLon / stay.count,
+      radius: Math.round(stay.radius),
+      start: new Date(stay.start).toISOString(),
+      end: new Date(stay.end).toISOString(),
+      pointCount: stay.count + stay.outliers + (ongoing ? this.outside.length : 0),
+      ongoing,
+    };
+  }
+
+  private tripSegment(trip: TripState, ongoing: boolean): TripSegment {
+    return {
+      type: 'trip',
+      deviceId: this.deviceId,
+      start: new Date(trip.start).toISOString(),
+      end: new Date(trip.end).toISOString(),
+      distance: Math.round(trip.distance),
+      pointCount: trip.pointCount,
+      ongoing,
+    };
+  }
+}
+
+// A stored fix as read back for segmentation
+export interface SegmentSourceRow extends SegmentPoint {
+  id: string;
+  created_at: string | Date;
+  created_key: string; // created_at as exact text, for keyset paging
+}
+
+export interface CursorState {
+  createdAt: number | null;
+  seen: Array<[string, number]>; // [location id, created_at ms] inside the overlap window
+}
+
+export interface StoredSegments {
+  segmenter: SegmenterState;
+  cursor: CursorState;
+  backfillFrom: number | null; // oldest backfilled fix not folded in yet
+}
+
+// Storage the SegmentStore reads fixes from and persists its state to
+// (implemented by PostgresDatabase).
+export interface SegmentSource {
+  loadSegmentState(userId: string, deviceId: string): Promise<StoredSegments | null>;
+  saveSegmentState(userId: string, deviceId: string, state: StoredSegments): Promise<void>;
+  getLocationsSince(userId: string, deviceId: string, since: string | null, limit: number): Promise<SegmentSourceRow[]>;
+  getLocationsCreatedAfter(
+    userId: string,
+    deviceId: string,
+    after: { createdKey: string; id: string } | null,
+    limit: number
+  ): Promise<SegmentSourceRow[]>;
+}
+
+// created_at is the inserting transaction's start time, so a fix that commits
+// late can carry a created_at slightly older than one already read. Each
+// catch-up re-reads this window and skips the ids it has already seen.
+const CURSOR_OVERLAP_MS = 30 * 1000;
+const ZERO_UUID = '00000000-0000-0000-0000-000000000000';
+
+// Insertion-order cursor over a device's stored fixes.
+class IngestCursor {
+  private createdAt = -Infinity;
+  private readonly seen = new Map<string, number>();
+  private pruneAt = 1024;
+
+  static fromState(state: CursorState): IngestCursor {
+    const cursor = new IngestCursor();
+    cursor.createdAt = state.createdAt ?? -Infinity;
+    for (const [id, t] of state.seen) {
+      cursor.seen.set(id, t);
+    }
+    return cursor;
+  }
+
+  toState(): CursorState {
+    this.prune();
+    return {
+      createdAt: Number.isFinite(this.createdAt) ? this.createdAt : null,
+      seen: Array.from(this.seen),
+    };
+  }
+
+  // Record a stored fix; false if it was consumed before.
+  observe(row: SegmentSourceRow): boolean {
+    if (this.seen.has(row.id)) return false;
+    const t = new Date(row.created_at).getTime();
+    if (!Number.isFinite(t)) return true;
+    if (t > this.createdAt) this.createdAt = t;
+    if (t >= this.createdAt - CURSOR_OVERLAP_MS) {
+      this.seen.set(row.id, t);
+      if (this.seen.size >= this.pruneAt) {
+        this.prune();
+        this.pruneAt = Math.max(1024, this.seen.size * 2);
+      }
+    }
+    return true;
+  }
+
+  // Keyset position the next catch-up read starts from
+  windowStart(): { createdKey: string; id: string } | null {
+    if (!Number.isFinite(this.createdAt)) return null;
+    return { createdKey: new Date(this.createdAt - CURSOR_OVERLAP_MS).toISOString(), id: ZERO_UUID };
+  }
+
+  private prune(): void {
+    const min = this.createdAt - CURSOR_OVERLAP_MS;
+    for (const [id, t] of this.seen) {
+      if (t < min) this.seen.delete(id);
+    }
+  }
+}
+
+interface DeviceEntry {
+  segmenter: DeviceSegmenter;
+  cursor: IngestCursor;
+  backfillFrom: number | null;
+}
+
+interface QueuedRefresh {
+  promise: Promise<DeviceEntry | null>;
+  defer: boolean; // leave backfills for a later rebuild
+}
+
+const fixTime = (p: SegmentPoint) => new Date(p.timestamp).getTime();
+
+// Keeps segmenters for recently used devices in memory (least recently used
+// are dropped past `maxDevices`) and persists each one's state with its
+// cursor, so a restart resumes instead of re-scanning history. Fixes newer
+// than the segmenter are pushed. A backfilled (older) fix needs a rebuild
+// from the last stay closure before it; ingests only note it and schedule
+// one rebuild per `rebuildDelayMs`, while reads apply it right away.
+export class SegmentStore {
+  private readonly entries = new Map<string, DeviceEntry>(); // least recently used first
+  private readonly queued = new Map<string, QueuedRefresh>();
+  private readonly running = new Map<string, Promise<DeviceEntry | null>>();
+  private readonly rebuilds = new Map<string, ReturnType<typeof setTimeout>>();
+
+  constructor(
+    private readonly source: SegmentSource,
+    private readonly options: Partial<SegmenterOptions> = {},
+    private readonly maxDevices: number = 1000,
+    private readonly rebuildDelayMs: number = REBUILD_DELAY_MS
+  ) {}
+
+  async getSegments(userId: string, deviceId: string): Promise<Segment[]> {
+    const entry = await this.update(userId, deviceId, false);
+    return entry ? entry.segmenter.segments() : [];
+  }
+
+  // Call after fixes were stored for a device to fold them in right away.
+  async ingest(userId: string, deviceId: string): Promise<void> {
+    await this.update(userId, deviceId, true);
+  }
+
+  // Refreshes run one at a time per device. A caller arriving while one is
+  // running waits for a single follow-up refresh, shared with anyone else
+  // who arrives before it starts, so no stored fix is missed.
+  private update(userId: string, deviceId: string, defer: boolean): Promise<DeviceEntry | null> {
+    const key = `${userId}:${deviceId}`;
+    const queued = this.queued.get(key);
+    if (queued) {
+      queued.defer = queued.defer && defer;
+      return queued.promise;
+    }
+
+    const previous = this.running.get(key) ?? Promise.resolve(null);
+    const request = { defer } as QueuedRefresh;
+    request.promise = previous
+      .catch(() => null)
+      .then(() => {
+        this.queued.delete(key);
+        this.running.set(key, request.promise);
+        return this.refresh(key, userId, deviceId, request.defer);
+      })
+      .finally(() => {
+        if (this.running.get(key) === request.promise) this.running.delete(key);
+      });
+    this.queued.set(key, request);
+    return request.promise;
+  }
+
+  private async refresh(key: string, userId: string, deviceId: string, defer: boolean): Promise<DeviceEntry | null> {
+    let entry = this.entries.get(key) ?? null;
+    this.entries.delete(key);
+    if (!entry) {
+      const stored = await this.source.loadSegmentState(userId, deviceId);
+      if (stored) {
+        entry = {
+          segmenter: DeviceSegmenter.fromState(deviceId, stored.segmenter, this.options),
+          cursor: IngestCursor.fromState(stored.cursor),
+          backfillFrom: stored.backfillFrom,
+        };
+      }
+    }
+
+    let changed = true;
+    if (entry) {
+      const fresh = await this.readNew(userId, deviceId, entry.cursor);
+      const last = entry.segmenter.lastTimestamp;
+      if (fresh === null) {
+        entry = await this.rebuild(userId, deviceId, null);
+      } else {
+        let backfilled = false;
+        if (fresh.length > 0 && last !== null && fixTime(fresh[0]) <= Date.parse(last)) {
+          entry.backfillFrom = Math.min(entry.backfillFrom ?? Infinity, fixTime(fresh[0]));
+          backfilled = true;
+        }
+        changed = entry.segmenter.push(fresh) > 0 || backfilled;
+        if (entry.backfillFrom !== null) {
+          if (defer) {
+            this.scheduleRebuild(key, userId, deviceId);
+          } else {
+            entry = await this.rebuild(userId, deviceId, entry);
+            changed = true;
+          }
+        }
+      }
+    } else {
+      entry = await this.rebuild(userId, deviceId, null);
+    }
+    // No fixes at all: nothing to cache or persist
+    if (!entry) return null;
+
+    if (changed) {
+      await this.source.saveSegmentState(userId, deviceId, {
+        segmenter: entry.segmenter.toState(),
+        cursor: entry.cursor.toState(),
+        backfillFrom: entry.backfillFrom,
+      });
+    }
+    this.entries.set(key, entry);
+    if (this.entries.size > this.maxDevices) {
+      this.entries.delete(this.entries.keys().next().value as string);
+    }
+    return entry;
+  }
+
+  private scheduleRebuild(key: string, userId: string, deviceId: string): void {
+    if (this.rebuilds.has(key)) return;
+    const timer = setTimeout(() => {
+      this.rebuilds.delete(key);
+      this.update(userId, deviceId, false).catch(error => {
+        console.error(`Failed to rebuild segments for ${deviceId}:`, error);
+      });
+    }, this.rebuildDelayMs);
+    // Don't hold the process open just for this
+    timer.unref?.();
+    this.rebuilds.set(key, timer);
+  }
+
+  // Fixes stored since the cursor, oldest timestamp first, or null when so
+  // many arrived that a rebuild is cheaper than holding them.
+  private async readNew(userId: string, deviceId: string, cursor: IngestCursor): Promise<SegmentSourceRow[] | null> {
+    const fresh: SegmentSourceRow[] = [];
+    let after = cursor.windowStart();
+    for (;;) {
+      const rows = await this.source.getLocationsCreatedAfter(userId, deviceId, after, SEGMENT_PAGE_SIZE);
+      for (const row of rows) {
+        if (cursor.observe(row)) fresh.push(row);
+      }
+      if (fresh.length > SEGMENT_PAGE_SIZE * 4) return null;
+      if (rows.length < SEGMENT_PAGE_SIZE) break;
+      const last = rows[rows.length - 1];
+      after = { createdKey: last.created_key, id: last.id };
+    }
+    fresh.sort((a, b) => fixTime(a) - fixTime(b));
+    return fresh;
+  }
+
+  // Pass over the device's history in timestamp order: from the last stay
+  // closure before a pending backfill when there is one, else from scratch.
+  private async rebuild(userId: string, deviceId: string, from: DeviceEntry | null): Promise<DeviceEntry | null> {
+    const key = `${userId}:${deviceId}`;
+    clearTimeout(this.rebuilds.get(key));
+    this.rebuilds.delete(key);
+
+    const resumed = from && from.backfillFrom !== null ? from.segmenter.rewind(from.backfillFrom) : null;
+    const segmenter = resumed ?? new DeviceSegmenter(deviceId, this.options);
+    const cursor = from ? from.cursor : new IngestCursor();
+    let since = segmenter.lastTimestamp;
+    for (;;) {
+      const rows = await this.source.getLocationsSince(userId, deviceId, since, SEGMENT_PAGE_SIZE);
+      for (const row of rows) {
+        cursor.observe(row);
+      }
+      segmenter.push(rows);
+      if (rows.length < SEGMENT_PAGE_SIZE) break;
+      since = new Date(rows[rows.length - 1].timestamp).toISOString();
+    }
+    return segmenter.lastTimestamp !== null ? { segmenter, cursor, backfillFrom: null } : null;
+  }
+}
@@ -7,6 +7,7 @@ import dotenv from 'dotenv';
 import path from 'path';
 import fs from 'fs';
 import { PostgresDatabase, generateToken, verifyToken, JWTPayload } from './postgres';
+import { SegmentStore } from './segments';
 
 // Load environment variables from multiple possible locations to be robust to CWD
 const envLoadedFrom: string[] = [];
@@ -85,6 +86,16 @@ const PORT = process.env.PORT || 3001;
 // Initialize PostgreSQL database
 const db = new PostgresDatabase();
 
+// Stay/trip segments, built incrementally per device and persisted in PostgreSQL
+const segmentStore = new SegmentStore(db);
+
+// Fold newly stored fixes into the device's segments without delaying the response
+const ingestSegments = (userId: string, deviceId: string) => {
+  segmentStore.ingest(userId, deviceId).catch(error => {
+    console.error(`Error updating segments for ${deviceId}:`, error);
+  });
+};
+
 // Middleware
 app.use(helmet());
 app.use(cors({
@@ -419,6 +430,99 @@ app.get('/api/locations/history', optionalAuth, async (req, res) => {
   }
 });
 
+// Get history inside the visible map area, downsampled to the zoom level.
+// Points closer than a few screen pixels at that zoom are merged into one
+// weighted point, so the payload stays bounded however much history exists.
+// If the cells still hold more than `limit` points they are made coarser;
+// `truncated` tells the client when even the coarsest pass hit the limit.
+const VIEWPORT_CELL_PX = 8;
+const VIEWPORT_MAX_CELL_PX = 64;
+const VIEWPORT_RAW_ZOOM = 20; // from here on every fix is sent individually
+const VIEWPORT_DEFAULT_DAYS = 30;
+
+app.get('/api/locations/viewport', optionalAuth, async (req, res) => {
+  try {
+    const payload = (req as any).user as JWTPayload;
+    const userId = payload?.userId || '00000000-0000-0000-0000-000000000000'; // Demo user fallback
+
+    const south = parseFloat(req.query.south as string);
+    const west = parseFloat(req.query.west as string);
+    const north = parseFloat(req.query.north as string);
+    const east = parseFloat(req.query.east as string);
+    const zoom = parseFloat(req.query.zoom as string);
+    if (![south, west, north, east, zoom].every(Number.isFinite) || south > north || west > east) {
+      return res.status(400).json({ error: 'Expected numeric south, west, north, east and zoom' });
+    }
+    const since = req.query.since
+      ? new Date(req.query.since as string)
+      : new Date(Date.now() - VIEWPORT_DEFAULT_DAYS * 24 * 60 * 60 * 1000);
+    const until = req.query.until ? new Date(req.query.until as string) : null;
+    if (isNaN(since.getTime()) || (until && isNaN(until.getTime()))) {
+      return res.status(400).json({ error: 'Expected ISO timestamps for since and until' });
+    }
+    const deviceId = (req.query.deviceId as string) || undefined;
+    const limit = Math.min(parseInt(req.query.limit as string) || 20000, 50000);
+
+    const bounds = { south: Math.max(south, -90), west: Math.max(west, -180), north: Math.min(north, 90), east: Math.min(east, 180) };
+    const range = { since: since.toISOString(), until: until?.toISOString() };
+
+    // Degrees per screen pixel at this zoom (256px tiles); latitude cells shrink with cos(lat)
+    const degPerPx = 360 / (256 * Math.pow(2, Math.max(0, Math.min(zoom, 22))));
+    const cosLat = Math.max(0.01, Math.cos(((south + north) / 2) * Math.PI / 180));
+
+    let cellPx = zoom >= VIEWPORT_RAW_ZOOM ? 0 : VIEWPORT_CELL_PX;
+    let points;
+    for (;;) {
+      const cell = cellPx > 0 ? { lat: degPerPx * cellPx * cosLat, lng: degPerPx * cellPx } : null;
+      points = await db.getViewportLocations(userId, bounds, cell, range, deviceId, limit + 1);
+      if (points.length <= limit || cellPx >= VIEWPORT_MAX_CELL_PX) break;
+      cellPx = cellPx > 0 ? cellPx * 2 : VIEWPORT_CELL_PX;
+    }
+    const truncated = points.length > limit;
+    res.json({ points: truncated ? points.slice(0, limit) : points, cellPx, truncated });
+  } catch (error) {
+    console.error('Error fetching viewport locations:', error);
+    res.status(500).json({ error: 'Failed to fetch viewport locations' });
+  }
+});
+
+// Get stay/trip segments for a specific device
+app.get('/api/locations/segments/:deviceId', optionalAuth, async (req, res) => {
+  try {
+    const payload = (req as any).user as JWTPayload;
+    const userId = payload?.userId || '00000000-0000-0000-0000-000000000000'; // Demo user fallback
+    const { deviceId } = req.params;
+
+    const devices = await db.getUserDevices(userId);
+    if (!devices.some(device => device.device_id === deviceId)) {
+      return res.status(404).json({ error: 'Device not found' });
+    }
+
+    const segments = await segmentStore.getSegments(userId, deviceId);
+    res.json(segments);
+  } catch (error) {
+    console.error('Error fetching location segments:', error);
+    res.status(500).json({ error: 'Failed to fetch location segments' });
+  }
+});
+
+// Get stay/trip segments for all devices
+app.get('/api/locations/segments', optionalAuth, async (req, res) => {
+  try {
+    const payload = (req as any).user as JWTPayload;
+    const userId = payload?.userId || '00000000-0000-0000-0000-000000000000'; // Demo user fallback
+
+    const devices = await db.getUserDevices(userId);
+    const perDevice = await Promise.all(devices.map(device =>
+      segmentStore.getSegments(userId, device.device_id)
+    ));
+    res.json(perDevice.flat());
+  } catch (error) {
+    console.error('Error fetching all location segments:', error);
+    res.status(500).json({ error: 'Failed to fetch location segments' });
+  }
+});
+
 // Update location (from Mac client or authenticated API)
 app.post('/api/locations/update', optionalAuth, async (req, res) => {
   try {
@@ -457,6 +561,7 @@ app.post('/api/locations/update', optionalAuth, async (req, res) => {
       
       // Broadcast to all connected clients (TODO: filter by user)
       io.emit('location_update', savedLocation);
+      ingestSegments(userId, locationUpdate.deviceId);
       
       console.log(`[NEW] ${locationUpdate.deviceId} @ ${locationUpdate.latitude},${locationUpdate.longitude} ${locationUpdate.timestamp}`);
       
@@ -492,6 +597,7 @@ app.post('/api/locations/batch-update', optionalAuth, async (req, res) => {
     }
 
     const results = [];
+    const updatedDevices = new Set<string>();
     
     for (const update of locationUpdates) {
       try {
@@ -520,6 +626,7 @@ app.post('/api/locations/batch-update', optionalAuth, async (req, res) => {
             timestamp: update.timestamp
           });
           io.emit('location_update', savedLocation);
+          updatedDevices.add(update.deviceId);
           results.push({ ...savedLocation, isNew: true });
           
           console.log(`[NEW] ${update.deviceId} @ ${update.latitude},${update.longitude} ${update.timestamp}`);
@@ -530,6 +637,7 @@ app.post('/api/locations/batch-update', optionalAuth, async (req, res) => {
         console.error('Error processing location update:', update, error);
       }
     }
+    updatedDevices.forEach(deviceId => ingestSegments(userId, deviceId));
 
     res.json({ 
       success: true, 
@@ -1,7 +1,10 @@
 import React, { useEffect, useMemo, useRef, useState } from 'react';
 import { MapContainer, TileLayer, Popup, useMap, CircleMarker, Tooltip } from 'react-leaflet';
-import { Location, DeviceStatus } from '../types';
+import { Location, DeviceStatus, ViewportResult } from '../types';
 import { formatDistanceToNow, parseISO } from 'date-fns';
+import { LatLngBounds } from 'leaflet';
+import { ClusterLayer, ClusterPoint } from './ClusterLayer';
+import { apiService } from '../services/api';
 import 'leaflet/dist/leaflet.css';
 import './CatMap.css';
 
@@ -84,6 +87,67 @@ const MapBoundsUpdater: React.FC<{ locations: Location[]; fitKey?: number; lockR
   return null;
 };
 
+// How far back the viewport history reaches at least; further if older
+// history is already loaded
+const VIEWPORT_HISTORY_DAYS = 30;
+
+// What a viewport result covers: fixes since `since` inside `bounds`
+type ViewportState = ViewportResult & { since: number; bounds: LatLngBounds };
+
+// Level of detail: after each pan/zoom, ask the backend for history inside the
+// visible area downsampled to the current zoom, so zooming in reveals points
+// beyond the initially loaded history. Live fixes are merged in locally rather
+// than refetching. Falls back to local points on failure.
+const ViewportLoader: React.FC<{
+  deviceId: string | null;
+  oldest: number | null; // oldest loaded fix, so the viewport never covers less
+  onPoints: (result: ViewportState | null) => void;
+}> = ({ deviceId, oldest, onPoints }) => {
+  const map = useMap();
+
+  useEffect(() => {
+    let controller: AbortController | null = null;
+    let timer: ReturnType<typeof setTimeout> | undefined;
+
+    const load = () => {
+      controller?.abort();
+      const current = new AbortController();
+      controller = current;
+      const bounds = map.getBounds().pad(0.25);
+      const since = Math.min(Date.now() - VIEWPORT_HISTORY_DAYS * 24 * 60 * 60 * 1000, oldest ?? Infinity);
+      apiService.getViewportPoints(
+        { south: bounds.getSouth(), west: bounds.getWest(), north: bounds.getNorth(), east: bounds.getEast() },
+        map.getZoom(),
+        deviceId,
+        new Date(since).toISOString(),
+        current.signal
+      ).then(result => {
+        if (!current.signal.aborted) onPoints({ ...result, since, bounds });
+      }).catch(e => {
+        if (!current.signal.aborted) {
+          console.warn('Viewport history fetch failed; using loaded history:', e);
+          onPoints(null);
+        }
+      });
+    };
+
+    const schedule = () => {
+      clearTimeout(timer);
+      timer = setTimeout(load, 250);
+    };
+
+    schedule();
+    map.on('moveend', schedule);
+    return () => {
+      map.off('moveend', schedule);
+      clearTimeout(timer);
+      controller?.abort();
+    };
+  }, [map, deviceId, oldest, onPoints]);
+
+  return null;
+};
+
 export const CatMap: React.FC<CatMapProps> = ({ 
   locations, 
   deviceStatuses, 
@@ -93,8 +157,14 @@ export const CatMap: React.FC<CatMapProps> = ({
   fitTargets
 }) => {
   const [filteredLocations, setFilteredLocations] = useState<Location[]>([]);
+  const [viewport, setViewport] = useState<ViewportState | null>(null);
   const autoFitLockedRef = useRef(false);
 
+  // Viewport points belong to the previous selection; drop them until reloaded
+  useEffect(() => {
+    setViewport(null);
+  }, [selectedDevice]);
+
   // Component to register user interaction locks inside the map context
   const InteractionLock: React.FC = () => {
     const map = useMap();
@@ -162,6 +232,53 @@ export const CatMap: React.FC<CatMapProps> = ({
     return [...filteredLocations].sort((a, b) => new Date(a.timestamp).getTime() - new Date(b.timestamp).getTime());
   }, [filteredLocations]);
 
+  const latestLocation = sortedLocations.length > 0 ? sortedLocations[sortedLocations.length - 1] : null;
+  const oldestTime = sortedLocations.length > 0 ? new Date(sortedLocations[0].timestamp).getTime() : null;
+
+  // Map labels use the history board's numbering: newest is #1
+  const boardNumbers = useMemo(() => {
+    const newestFirst = [...filteredLocations].sort((a, b) => new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime());
+    return new Map(newestFirst.map((l, idx) => [`${l.deviceId}|${new Date(l.timestamp).getTime()}`, idx + 1]));
+  }, [filteredLocations]);
+
+  // History goes to the canvas cluster layer, without the latest fix (drawn
+  // as its own marker). Prefer the backend's viewport set, plus loaded fixes it
+  // doesn't cover: newer than the fetch, outside its bounds, or cut off by
+  // truncation.
+  const historyPoints = useMemo<ClusterPoint[]>(() => {
+    const time = (p: { timestamp: string }) => new Date(p.timestamp).getTime();
+    const labelled = (p: ClusterPoint): ClusterPoint => {
+      const label = p.count && p.count > 1 ? undefined : boardNumbers.get(`${p.deviceId}|${time(p)}`);
+      return label === undefined ? p : { ...p, label };
+    };
+    if (!viewport) return sortedLocations.slice(0, -1).map(labelled);
+
+    const latestTime = latestLocation ? time(latestLocation) : NaN;
+    let newest = viewport.since;
+    let oldest = Infinity;
+    const points: ClusterPoint[] = [];
+    for (const p of viewport.points) {
+      const t = time(p);
+      if (t > newest) newest = t;
+      if (t < oldest) oldest = t;
+      if (latestLocation && p.deviceId === latestLocation.deviceId && t === latestTime) {
+        // The latest fix is merged into this cell; keep the rest of it
+        if (p.count > 1) points.push({ ...p, count: p.count - 1 });
+        continue;
+      }
+      points.push(labelled(p));
+    }
+    const coveredFrom = viewport.truncated ? oldest : viewport.since;
+    for (const l of sortedLocations) {
+      if (l === latestLocation) continue;
+      const t = time(l);
+      const covered = t >= coveredFrom && t <= newest
+        && viewport.bounds.contains([Number(l.latitude), Number(l.longitude)]);
+      if (!covered) points.push(labelled(l));
+    }
+    return points.sort((a, b) => time(a) - time(b));
+  }, [viewport, sortedLocations, latestLocation, boardNumbers]);
+
   // No polyline; we will label markers numerically instead
 
   return (
@@ -189,10 +306,19 @@ export const CatMap: React.FC<CatMapProps> = ({
         
   <MapBoundsUpdater locations={filteredLocations} fitKey={fitKey} lockRef={autoFitLockedRef} fitTargets={fitTargets} />
         
-        {/* Draw points as circles; latest is larger and greener */}
-        {sortedLocations.map((location, index) => {
-          const total = sortedLocations.length;
-          const isLatest = index === total - 1;
+        {showHistory && (
+          <>
+            <ViewportLoader deviceId={selectedDevice} oldest={oldestTime} onPoints={setViewport} />
+            {/* Individual fixes carry their board number; the latest marker is #1 */}
+            <ClusterLayer points={historyPoints} deviceStatuses={deviceStatuses} />
+          </>
+        )}
+
+        {/* Draw points as circles; latest is larger and greener. In history
+            mode only the latest is a marker, the rest are on the cluster canvas. */}
+        {(showHistory ? (latestLocation ? [latestLocation] : []) : sortedLocations).map((location, index, shown) => {
+          const total = shown.length;
+          const isLatest = location === latestLocation;
           const recency = (index + 1) / total; // 0..1
           const radius = isLatest ? 9 : Math.max(3, Math.floor(6 * recency));
           const fillOpacity = isLatest ? 0.9 : 0.15 + 0.6 * recency; // fade older points
@@ -208,6 +334,7 @@ export const CatMap: React.FC<CatMapProps> = ({
               center={[lat, lng]}
               pathOptions={{ color, fillColor, fillOpacity, weight: isLatest ? 3 : 1 }}
               radius={radius}
+              bubblingMouseEvents={false}
             >
               {showHistory && (
                 <Tooltip permanent direction="center" className="marker-label">
@@ -221,6 +348,11 @@ export const CatMap: React.FC<CatMapProps> = ({
           );
         })}
       </MapContainer>
+      {showHistory && viewport?.truncated && (
+        <div className="viewport-notice">
+          Showing the {viewport.points.length.toLocaleString()} most recent places here; zoom in to see all history
+        </div>
+      )}
     </div>
   );
 };
\ No newline at end of file
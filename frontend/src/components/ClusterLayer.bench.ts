@@ -0,0 +1,100 @@
+// Opt-in benchmark, not part of `npm test`: run with `npm run bench`
+import L from 'leaflet';
+import { CanvasClusterLayer, ClusterPoint } from './ClusterLayer';
+
+// react-leaflet is ESM-only and only needed by the React wrapper
+jest.mock('react-leaflet', () => ({ useMap: jest.fn() }));
+
+const POINTS = 100_000;
+const WARMUP = 3;
+const RUNS = 7;
+const REDRAW_BUDGET_MS = 20; // a frame and change at 60 Hz
+const SIZE = L.point(1280, 800);
+
+// Deterministic random walk, like a tracker that has been running for a while
+const makePoints = (): ClusterPoint[] => {
+  let seed = 42;
+  const rand = () => (seed = (seed * 1664525 + 1013904223) % 4294967296) / 4294967296;
+  let lat = 37.77;
+  let lng = -122.42;
+  const start = Date.parse('2024-01-01T00:00:00Z');
+  const points: ClusterPoint[] = [];
+  for (let i = 0; i < POINTS; i++) {
+    lat += (rand() - 0.5) * 0.002;
+    lng += (rand() - 0.5) * 0.002;
+    points.push({ deviceId: 'cat', latitude: lat, longitude: lng, timestamp: new Date(start + i * 60000).toISOString() });
+  }
+  return points;
+};
+
+// Just enough of L.Map for the layer: a fixed-size, unpanned view on `center`
+const makeMap = (center: L.LatLng) => {
+  const pane = document.createElement('div');
+  const view = { zoom: 3 };
+  const map = {
+    getPane: () => pane,
+    createPane: () => pane,
+    getContainer: () => document.createElement('div'),
+    on: () => map,
+    off: () => map,
+    getSize: () => SIZE,
+    getZoom: () => view.zoom,
+    getMaxZoom: () => 22,
+    containerPointToLayerPoint: (p: L.PointTuple) => L.point(p),
+    getPixelOrigin: () => L.CRS.EPSG3857.latLngToPoint(center, view.zoom).subtract(SIZE.divideBy(2)).round(),
+  };
+  return { map: map as unknown as L.Map, view };
+};
+
+describe('CanvasClusterLayer redraw', () => {
+  beforeAll(() => {
+    // jsdom has no 2D canvas; painting calls become no-ops so only the
+    // layer's own projection/bucketing work is measured
+    const ctx = new Proxy({} as Record<string | symbol, unknown>, {
+      get: (target, key) => (key in target ? target[key] : () => undefined),
+      set: (target, key, value) => {
+        target[key] = value;
+        return true;
+      },
+    });
+    jest.spyOn(HTMLCanvasElement.prototype, 'getContext').mockImplementation((() => ctx) as any);
+  });
+
+  afterAll(() => {
+    jest.restoreAllMocks();
+  });
+
+  // A layer holding the whole walk, viewed around its newest fix
+  const points = makePoints();
+  const makeLayer = (zoom: number) => {
+    const last = points[POINTS - 1];
+    const { map, view } = makeMap(L.latLng(last.latitude, last.longitude));
+    view.zoom = zoom;
+    const layer = new CanvasClusterLayer();
+    layer.onAdd(map);
+    layer.setData(points);
+    return layer;
+  };
+
+  it.each([3, 8, 12, 15, 18, 22])('redraws 100k points within budget at zoom %i', zoom => {
+    const layer = makeLayer(zoom);
+
+    // The first redraws at a new zoom pay for JIT warm-up, not steady-state panning
+    for (let r = 0; r < WARMUP; r++) layer.redraw();
+    const times: number[] = [];
+    for (let r = 0; r < RUNS; r++) {
+      const t = performance.now();
+      layer.redraw();
+      times.push(performance.now() - t);
+    }
+    times.sort((a, b) => a - b);
+
+    expect(times[RUNS >> 1]).toBeLessThan(REDRAW_BUDGET_MS);
+  });
+
+  it('clusters every fix when zoomed out', () => {
+    // Zoomed out the whole walk is on screen, so every fix lands in a cluster
+    const layer = makeLayer(3);
+    expect(layer['drawn'].reduce((sum, d) => sum + d.weight, 0)).toBe(POINTS);
+  });
+});
@@ -0,0 +1,368 @@
+import React, { useEffect, useRef } from 'react';
+import L from 'leaflet';
+import { useMap } from 'react-leaflet';
+import { formatDistanceToNow, parseISO } from 'date-fns';
+import { DeviceStatus } from '../types';
+
+export interface ClusterPoint {
+  deviceId: string;
+  latitude: number;
+  longitude: number;
+  timestamp: string;
+  count?: number; // fixes already merged into this point by the backend
+  label?: number; // number drawn on the point when it isn't clustered
+}
+
+interface ClusterLayerProps {
+  points: ClusterPoint[]; // oldest first; recency drives point styling
+  deviceStatuses: DeviceStatus[];
+}
+
+interface DrawnCluster {
+  x: number; // container px
+  y: number;
+  r: number;
+  weight: number;
+  newest: number; // index of newest member point
+  col: number; // grid cell in global px at the drawn zoom
+  row: number;
+  minX: number; // member extent in global px at the drawn zoom
+  minY: number;
+  maxX: number;
+  maxY: number;
+}
+
+const CLUSTER_CELL_PX = 48;
+const CANVAS_PADDING = 0.25; // canvas overhang per side, so short pans stay drawn until moveend
+const MAX_LABELS = 300;
+const MAX_STACK_ENTRIES = 10;
+const MAX_LAT = 85.0511287798;
+
+const formatCount = (n: number) => (n >= 1000 ? `${(n / 1000).toFixed(n >= 10000 ? 0 : 1)}k` : String(n));
+
+// Draws history points on a single canvas with zoom-dependent grid clustering.
+// Points are projected once to zoom-0 Web Mercator pixels; each redraw only
+// scales, buckets and paints what falls inside the (padded) viewport. At the
+// map's max zoom only fixes on the same pixel are stacked, and clicking a
+// stack lists its members.
+export class CanvasClusterLayer extends L.Layer {
+  private map: L.Map | null = null;
+  private canvas: HTMLCanvasElement | null = null;
+  private points: ClusterPoint[] = [];
+  private wx = new Float64Array(0);
+  private wy = new Float64Array(0);
+  private weights = new Float64Array(0);
+  private drawn: DrawnCluster[] = [];
+  private drawnZoom = 0;
+  private drawnCell = CLUSTER_CELL_PX;
+  private statuses = new Map<string, boolean>();
+  private hovering = false;
+
+  setData(points: ClusterPoint[]): void {
+    const n = points.length;
+    this.points = points;
+    this.wx = new Float64Array(n);
+    this.wy = new Float64Array(n);
+    this.weights = new Float64Array(n);
+    for (let i = 0; i < n; i++) {
+      const p = points[i];
+      const lat = Math.max(-MAX_LAT, Math.min(MAX_LAT, p.latitude));
+      const sin = Math.sin(lat * Math.PI / 180);
+      this.wx[i] = ((p.longitude + 180) / 360) * 256;
+      this.wy[i] = (0.5 - Math.log((1 + sin) / (1 - sin)) / (4 * Math.PI)) * 256;
+      this.weights[i] = p.count && p.count > 0 ? p.count : 1;
+      if (!Number.isFinite(this.wx[i]) || !Number.isFinite(this.wy[i])) {
+        this.weights[i] = 0; // skipped when drawing
+      }
+    }
+    this.redraw();
+  }
+
+  setDeviceStatuses(deviceStatuses: DeviceStatus[]): void {
+    this.statuses = new Map(deviceStatuses.map(s => [s.deviceId, s.isOnline]));
+  }
+
+  onAdd(map: L.Map): this {
+    this.map = map;
+    const pane = map.getPane('clusterPane') || map.createPane('clusterPane');
+    pane.style.zIndex = '390'; // just below the overlay pane holding the latest-location marker
+    pane.style.pointerEvents = 'none';
+    this.canvas = L.DomUtil.create('canvas', 'cluster-canvas leaflet-zoom-hide', pane);
+    map.on('moveend resize viewreset', this.redraw, this);
+    map.on('click', this.handleClick, this);
+    map.on('mousemove', this.handleMouseMove, this);
+    this.redraw();
+    return this;
+  }
+
+  onRemove(map: L.Map): this {
+    map.off('moveend resize viewreset', this.redraw, this);
+    map.off('click', this.handleClick, this);
+    map.off('mousemove', this.handleMouseMove, this);
+    if (this.canvas) L.DomUtil.remove(this.canvas);
+    if (this.hovering) map.getContainer().style.cursor = '';
+    this.canvas = null;
+    this.map = null;
+    return this;
+  }
+
+  redraw(): void {
+    const map = this.map;
+    const canvas = this.canvas;
+    if (!map || !canvas) return;
+
+    const size = map.getSize();
+    const padX = Math.round(size.x * CANVAS_PADDING);
+    const padY = Math.round(size.y * CANVAS_PADDING);
+    const width = size.x + 2 * padX;
+    const height = size.y + 2 * padY;
+    const dpr = window.devicePixelRatio || 1;
+    if (canvas.width !== Math.round(width * dpr) || canvas.height !== Math.round(height * dpr)) {
+      canvas.width = Math.round(width * dpr);
+      canvas.height = Math.round(height * dpr);
+      canvas.style.width = `${width}px`;
+      canvas.style.height = `${height}px`;
+    }
+    const topLeft = map.containerPointToLayerPoint([-padX, -padY]);
+    L.DomUtil.setPosition(canvas, topLeft);
+
+    const ctx = canvas.getContext('2d');
+    if (!ctx) return;
+    ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+    ctx.clearRect(0, 0, width, height);
+
+    // Global pixel coordinates of the canvas' top-left corner at this zoom
+    const zoom = map.getZoom();
+    const scale = Math.pow(2, zoom);
+    const pixelOrigin = map.getPixelOrigin();
+    const ox = topLeft.x + pixelOrigin.x;
+    const oy = topLeft.y + pixelOrigin.y;
+
+    // Bucket visible points into a grid anchored to global pixels, so cells
+    // don't shift while panning at a fixed zoom.
+    const cell = zoom >= map.getMaxZoom() ? 1 : CLUSTER_CELL_PX;
+    const firstCol = Math.floor(ox / cell);
+    const firstRow = Math.floor(oy / cell);
+    const cols = Math.ceil(width / cell) + 2;
+    const cellIndex = new Map<number, number>();
+    const sumX: number[] = [];
+    const sumY: number[] = [];
+    const weight: number[] = [];
+    const newest: number[] = [];
+    const minX: number[] = [];
+    const minY: number[] = [];
+    const maxX: number[] = [];
+    const maxY: number[] = [];
+
+    const { wx, wy, weights } = this;
+    const n = wx.length;
+    for (let i = 0; i < n; i++) {
+      const w = weights[i];
+      if (w === 0) continue;
+      const gx = wx[i] * scale;
+      const gy = wy[i] * scale;
+      const x = gx - ox;
+      const y = gy - oy;
+      if (x < 0 || y < 0 || x >= width || y >= height) continue;
+      const key = (Math.floor(gy / cell) - firstRow) * cols + (Math.floor(gx / cell) - firstCol);
+      let c = cellIndex.get(key);
+      if (c === undefined) {
+        c = sumX.length;
+        cellIndex.set(key, c);
+        sumX.push(0); sumY.push(0); weight.push(0); newest.push(i);
+        minX.push(gx); minY.push(gy); maxX.push(gx); maxY.push(gy);
+      }
+      sumX[c] += x * w;
+      sumY[c] += y * w;
+      weight[c] += w;
+      newest[c] = i;
+      if (gx < minX[c]) minX[c] = gx;
+      if (gx > maxX[c]) maxX[c] = gx;
+      if (gy < minY[c]) minY[c] = gy;
+      if (gy > maxY[c]) maxY[c] = gy;
+    }
+
+    const drawn: DrawnCluster[] = [];
+    const labels = sumX.length <= MAX_LABELS;
+    ctx.textAlign = 'center';
+    ctx.textBaseline = 'middle';
+
+    for (let c = 0; c < sumX.length; c++) {
+      const x = sumX[c] / weight[c];
+      const y = sumY[c] / weight[c];
+      const i = newest[c];
+      let r: number;
+
+      if (weight[c] === 1) {
+        // Single fix: fade older points, as the per-marker rendering did
+        const recency = (i + 1) / n;
+        r = Math.max(3, Math.floor(6 * recency));
+        ctx.beginPath();
+        ctx.arc(x, y, r, 0, Math.PI * 2);
+        ctx.fillStyle = `rgba(59, 130, 246, ${0.15 + 0.6 * recency})`;
+        ctx.fill();
+        ctx.lineWidth = 1;
+        ctx.strokeStyle = '#1e40af';
+        ctx.stroke();
+        const label = labels ? this.points[i].label : undefined;
+        if (label !== undefined) {
+          ctx.font = '700 12px sans-serif';
+          ctx.lineWidth = 3;
+          ctx.strokeStyle = 'rgba(255, 255, 255, 0.9)';
+          ctx.strokeText(String(label), x, y);
+          ctx.fillStyle = '#111827';
+          ctx.fillText(String(label), x, y);
+        }
+      } else {
+        r = 12 + 4 * Math.log10(weight[c]);
+        ctx.beginPath();
+        ctx.arc(x, y, r, 0, Math.PI * 2);
+        ctx.fillStyle = 'rgba(59, 130, 246, 0.75)';
+        ctx.fill();
+        ctx.lineWidth = 2;
+        ctx.strokeStyle = '#1e40af';
+        ctx.stroke();
+        ctx.font = '700 11px sans-serif';
+        ctx.fillStyle = '#ffffff';
+        ctx.fillText(formatCount(weight[c]), x, y);
+      }
+
+      drawn.push({
+        x: x - padX, y: y - padY, r, weight: weight[c], newest: i,
+        col: Math.floor(minX[c] / cell), row: Math.floor(minY[c] / cell),
+        minX: minX[c], minY: minY[c], maxX: maxX[c], maxY: maxY[c],
+      });
+    }
+
+    this.drawn = drawn;
+    this.drawnZoom = zoom;
+    this.drawnCell = cell;
+  }
+
+  // Indices of the points bucketed into a drawn cluster, newest first
+  private members(hit: DrawnCluster): number[] {
+    const scale = Math.pow(2, this.drawnZoom);
+    const cell = this.drawnCell;
+    const result: number[] = [];
+    for (let i = this.wx.length - 1; i >= 0; i--) {
+      if (this.weights[i] === 0) continue;
+      if (Math.floor((this.wx[i] * scale) / cell) === hit.col && Math.floor((this.wy[i] * scale) / cell) === hit.row) {
+        result.push(i);
+      }
+    }
+    return result;
+  }
+
+  private hitTest(point: L.Point): DrawnCluster | null {
+    for (let k = this.drawn.length - 1; k >= 0; k--) {
+      const d = this.drawn[k];
+      const dx = point.x - d.x;
+      const dy = point.y - d.y;
+      if (dx * dx + dy * dy <= (d.r + 3) * (d.r + 3)) return d;
+    }
+    return null;
+  }
+
+  private handleMouseMove(e: L.LeafletMouseEvent): void {
+    const hit = this.hitTest(e.containerPoint) !== null;
+    if (hit !== this.hovering && this.map) {
+      this.hovering = hit;
+      this.map.getContainer().style.cursor = hit ? 'pointer' : '';
+    }
+  }
+
+  private handleClick(e: L.LeafletMouseEvent): void {
+    const map = this.map;
+    const hit = this.hitTest(e.containerPoint);
+    if (!map || !hit) return;
+
+    if (hit.weight > 1 && this.drawnZoom >= map.getMaxZoom()) {
+      // Can't zoom in any further: list what is stacked here instead
+      const point = this.points[hit.newest];
+      L.popup()
+        .setLatLng([point.latitude, point.longitude])
+        .setContent(this.buildStackPopup(this.members(hit), hit.weight))
+        .openOn(map);
+      return;
+    }
+
+    if (hit.weight > 1) {
+      const sw = map.unproject([hit.minX, hit.maxY], this.drawnZoom);
+      const ne = map.unproject([hit.maxX, hit.minY], this.drawnZoom);
+      if (hit.maxX - hit.minX < 1 && hit.maxY - hit.minY < 1) {
+        map.setView(sw, Math.min(map.getZoom() + 2, map.getMaxZoom()));
+      } else {
+        map.fitBounds(L.latLngBounds(sw, ne), { padding: [40, 40], maxZoom: map.getMaxZoom() });
+      }
+      return;
+    }
+
+    const point = this.points[hit.newest];
+    L.popup()
+      .setLatLng([point.latitude, point.longitude])
+      .setContent(this.buildPopup(point))
+      .openOn(map);
+  }
+
+  private buildPopup(point: ClusterPoint): HTMLElement {
+    const root = L.DomUtil.create('div', 'marker-popup');
+    const line = (label: string, value: string) => {
+      const p = L.DomUtil.create('p', '', root);
+      const strong = L.DomUtil.create('strong', '', p);
+      strong.textContent = label;
+      p.appendChild(document.createTextNode(` ${value}`));
+      return p;
+    };
+    L.DomUtil.create('h4', '', root).textContent = `🐱 ${point.deviceId}`;
+    line('Location:', `${point.latitude.toFixed(6)}, ${point.longitude.toFixed(6)}`);
+    line('Last seen:', formatDistanceToNow(parseISO(point.timestamp), { addSuffix: true }));
+    const isOnline = this.statuses.get(point.deviceId);
+    const status = line('Status:', '');
+    const span = L.DomUtil.create('span', `status ${isOnline ? 'online' : 'offline'}`, status);
+    span.textContent = isOnline ? ' 🟢 Online' : ' 🔴 Offline';
+    line('Timestamp:', new Date(point.timestamp).toLocaleString());
+    return root;
+  }
+
+  private buildStackPopup(members: number[], weight: number): HTMLElement {
+    const root = L.DomUtil.create('div', 'marker-popup');
+    const devices = Array.from(new Set(members.map(i => this.points[i].deviceId)));
+    L.DomUtil.create('h4', '', root).textContent = `🐱 ${devices.join(', ')}`;
+    L.DomUtil.create('p', '', root).textContent = `${weight} fixes at this spot`;
+    const list = L.DomUtil.create('ul', 'stack-list', root);
+    for (const i of members.slice(0, MAX_STACK_ENTRIES)) {
+      const point = this.points[i];
+      const count = point.count && point.count > 1 ? ` (${point.count} merged)` : '';
+      L.DomUtil.create('li', '', list).textContent = `${new Date(point.timestamp).toLocaleString()}${count}`;
+    }
+    if (members.length > MAX_STACK_ENTRIES) {
+      L.DomUtil.create('li', '', list).textContent = `… ${members.length - MAX_STACK_ENTRIES} more`;
+    }
+    return root;
+  }
+}
+
+export const ClusterLayer: React.FC<ClusterLayerProps> = ({ points, deviceStatuses }) => {
+  const map = useMap();
+  const layerRef = useRef<CanvasClusterLayer | null>(null);
+
+  useEffect(() => {
+    const layer = new CanvasClusterLayer();
+    layer.addTo(map);
+    layerRef.current = layer;
+    return () => {
+      layer.remove();
+      layerRef.current = null;
+    };
+  }, [map]);
+
+  useEffect(() => {
+    layerRef.current?.setData(points);
+  }, [points]);
+
+  useEffect(() => {
+    layerRef.current?.setDeviceStatuses(deviceStatuses);
+  }, [deviceStatuses]);
+
+  return null;
+};
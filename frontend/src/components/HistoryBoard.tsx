@@ -1,6 +1,7 @@
-import React, { useMemo } from 'react';
-import { Location } from '../types';
-import { formatDistanceToNow, parseISO } from 'date-fns';
+import React, { useEffect, useMemo, useState } from 'react';
+import { Location, Segment } from '../types';
+import { apiService } from '../services/api';
+import { format, formatDistanceStrict, formatDistanceToNow, parseISO } from 'date-fns';
 import './HistoryBoard.css';
 
 export interface HistoryBoardProps {
@@ -12,6 +13,55 @@ export interface HistoryBoardProps {
 
 const makeKey = (l: Location) => `${l.deviceId}|${l.timestamp}`;
 
+const formatMeters = (m: number) => (m >= 1000 ? `${(m / 1000).toFixed(1)} km` : `${m} m`);
+
+// Stays and trips, newest first; a stay can be clicked to focus the map on it
+const SegmentList: React.FC<{
+  segments: Segment[];
+  selectedLocationKey: string | null;
+  onSelect: (loc: Location) => void;
+}> = ({ segments, selectedLocationKey, onSelect }) => (
+  <ul className="history-list">
+    {segments.map(seg => {
+      const start = parseISO(seg.start);
+      const end = parseISO(seg.end);
+      const duration = formatDistanceStrict(start, end);
+      const span = `${format(start, 'MMM d HH:mm')} – ${seg.ongoing ? 'now' : format(end, 'HH:mm')}`;
+      if (seg.type === 'trip') {
+        return (
+          <li key={`trip|${seg.deviceId}|${seg.start}`} className="history-item segment trip">
+            <span className="badge">🚶</span>
+            <div className="meta">
+              <div className="row1">
+                <span className="device">Trip · {formatMeters(seg.distance)} · {duration}</span>
+              </div>
+              <div className="row2">{span}</div>
+            </div>
+          </li>
+        );
+      }
+      const loc: Location = { deviceId: seg.deviceId, latitude: seg.latitude, longitude: seg.longitude, timestamp: seg.end };
+      const isSelected = selectedLocationKey === makeKey(loc);
+      return (
+        <li
+          key={`stay|${seg.deviceId}|${seg.start}`}
+          className={`history-item segment stay ${isSelected ? 'selected' : ''}`}
+          onClick={() => onSelect(loc)}
+        >
+          <span className="badge">📍</span>
+          <div className="meta">
+            <div className="row1">
+              <span className="device">Stay · {duration}</span>
+              <span className="time">±{formatMeters(seg.radius)}</span>
+            </div>
+            <div className="row2">{span}</div>
+          </div>
+        </li>
+      );
+    })}
+  </ul>
+);
+
 export const HistoryBoard: React.FC<HistoryBoardProps> = ({
   locations,
   selectedDevice,
@@ -30,10 +80,39 @@ export const HistoryBoard: React.FC<HistoryBoardProps> = ({
     }));
   }, [locations, selectedDevice]);
 
+  // Stays/trips come from the server; refetch when a newer fix shows up
+  const newestTimestamp = useMemo(
+    () => locations.reduce((max, l) => (l.timestamp > max ? l.timestamp : max), ''),
+    [locations]
+  );
+  const [segments, setSegments] = useState<Segment[]>([]);
+  useEffect(() => {
+    let cancelled = false;
+    const load = selectedDevice ? apiService.getDeviceSegments(selectedDevice) : apiService.getAllSegments();
+    load
+      .then(result => {
+        if (cancelled) return;
+        const newestFirst = [...result].sort((a, b) => parseISO(b.start).getTime() - parseISO(a.start).getTime());
+        setSegments(newestFirst.slice(0, 20));
+      })
+      .catch(e => {
+        if (!cancelled) console.warn('Segments fetch failed:', e);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [selectedDevice, newestTimestamp]);
+
   // Always show history
 
   return (
     <div className="history-board">
+      {segments.length > 0 && (
+        <>
+          <h3>Stays &amp; Trips</h3>
+          <SegmentList segments={segments} selectedLocationKey={selectedLocationKey} onSelect={onSelect} />
+        </>
+      )}
       <h3>Recent History</h3>
       {filtered.length === 0 ? (
         <p className="empty">No history available</p>
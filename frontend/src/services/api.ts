@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { Location, DeviceStatus, Device, DeviceCode } from '../types';
+import { Location, DeviceStatus, Device, DeviceCode, Segment, ViewportPoint, ViewportResult } from '../types';
 import { tokenService } from './auth';
 
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:3001';
@@ -69,6 +69,43 @@ export const apiService = {
     } as Location));
   },
 
+  // Get history inside a map viewport, downsampled by the backend for the zoom level
+  async getViewportPoints(
+    bounds: { south: number; west: number; north: number; east: number },
+    zoom: number,
+    deviceId?: string | null,
+    since?: string,
+    signal?: AbortSignal
+  ): Promise<ViewportResult> {
+    const response = await api.get('/api/locations/viewport', {
+      params: { ...bounds, zoom, deviceId: deviceId || undefined, since },
+      signal,
+    });
+    const data = response.data || {};
+    return {
+      points: (data.points || []).map((p: any) => ({
+        ...p,
+        latitude: Number(p.latitude),
+        longitude: Number(p.longitude),
+        count: Number(p.count) || 1,
+      } as ViewportPoint)),
+      cellPx: Number(data.cellPx) || 0,
+      truncated: data.truncated === true,
+    };
+  },
+
+  // Get stays and trips for a specific device
+  async getDeviceSegments(deviceId: string): Promise<Segment[]> {
+    const response = await api.get(`/api/locations/segments/${deviceId}`);
+    return response.data || [];
+  },
+
+  // Get stays and trips for all devices
+  async getAllSegments(): Promise<Segment[]> {
+    const response = await api.get('/api/locations/segments');
+    return response.data || [];
+  },
+
   // Get device status
   async getDeviceStatus(): Promise<DeviceStatus[]> {
     const response = await api.get('/api/devices/status');
@@ -22,6 +22,46 @@ export interface DeviceStatus {
   isOnline: boolean;
 }
 
+// History point from the viewport endpoint; `count` fixes merged into one
+export interface ViewportPoint {
+  deviceId: string;
+  latitude: number;
+  longitude: number;
+  count: number;
+  timestamp: string;
+}
+
+export interface ViewportResult {
+  points: ViewportPoint[];
+  cellPx: number;     // merge cell size the server used (0 = raw fixes)
+  truncated: boolean; // more points matched than were returned
+}
+
+// Stay/trip segments derived from location history
+export interface StaySegment {
+  type: 'stay';
+  deviceId: string;
+  latitude: number;
+  longitude: number;
+  radius: number;
+  start: string;
+  end: string;
+  pointCount: number;
+  ongoing: boolean;
+}
+
+export interface TripSegment {
+  type: 'trip';
+  deviceId: string;
+  start: string;
+  end: string;
+  distance: number;
+  pointCount: number;
+  ongoing: boolean;
+}
+
+export type Segment = StaySegment | TripSegment;
+
 // Authentication types
 export interface User {
   id: string;
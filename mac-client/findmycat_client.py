@@ -34,8 +34,10 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class FindMyCatClient:
-    def __init__(self, server_url: str = DEFAULT_SERVER_URL, token: Optional[str] = None):
+    def __init__(self, server_url: str = DEFAULT_SERVER_URL, token: Optional[str] = None,
+                 cache_path: str = DB_PATH):
         self.server_url = server_url.rstrip('/')
+        self.cache_path = cache_path
         self.last_mtime: Optional[float] = None
         self.last_seen: Dict[str, int] = {}
         self.session = requests.Session()
@@ -63,7 +65,7 @@ class FindMyCatClient:
     def fetch_locations(self) -> List[Tuple[str, float, float, int, str]]:
         """Read JSON cache and return list of (device_id, lat, lon, ts, iso_time)."""
         try:
-            with open(DB_PATH, "r") as f:
+            with open(self.cache_path, "r") as f:
                 data = json.load(f)
         except (FileNotFoundError, json.JSONDecodeError, PermissionError) as e:
             logger.error(f"Error reading Find My cache: {e}")
@@ -206,7 +208,7 @@ class FindMyCatClient:
         """Run one cycle of location checking and updating"""
         try:
             # Check if cache file has been modified
-            current_mtime = os.path.getmtime(DB_PATH)
+            current_mtime = os.path.getmtime(self.cache_path)
             
             if self.last_mtime is None or current_mtime > self.last_mtime:
                 logger.info(f"🔄 Find My cache updated (mtime: {current_mtime})")
@@ -221,7 +223,7 @@ class FindMyCatClient:
                 return False
                 
         except FileNotFoundError:
-            logger.error(f"❌ Find My cache file not found: {DB_PATH}")
+            logger.error(f"❌ Find My cache file not found: {self.cache_path}")
             logger.error("   Make sure Find My is enabled and you're logged into iCloud")
             return False
         except Exception as e:
@@ -232,7 +234,7 @@ class FindMyCatClient:
         """Run continuous monitoring loop"""
         logger.info(f"🐱 FindMyCat client starting...")
         logger.info(f"📡 Server: {self.server_url}")
-        logger.info(f"📁 Cache: {DB_PATH}")
+        logger.info(f"📁 Cache: {self.cache_path}")
         logger.info(f"⏰ Poll interval: {poll_interval}s")
         
         # Test initial connection
@@ -277,6 +279,11 @@ def main():
         default=DEFAULT_SERVER_URL,
         help=f"Web server URL (default: {DEFAULT_SERVER_URL})"
     )
+    parser.add_argument(
+        "--cache",
+        default=DB_PATH,
+        help=f"Path to the Find My Items.data cache (default: {DB_PATH})"
+    )
     parser.add_argument(
         "--pair-code",
         help="Pair this Mac to your account using a pairing code generated from the web UI"
@@ -322,7 +329,7 @@ def main():
         except Exception as e:
             logger.warning(f"Could not read config file: {e}")
 
-    client = FindMyCatClient(args.server, token=saved_token)
+    client = FindMyCatClient(args.server, token=saved_token, cache_path=args.cache)
 
     # Pairing flow
     if args.pair_code:
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+FindMyCat Replay Harness
+Records or synthesizes Find My cache snapshots and replays them through
+FindMyCatClient against a local stand-in server, measuring end-to-end
+latency (cache write -> server acknowledgement), requests and bytes sent.
+Runs on any OS - no Mac or live Find My cache required.
+"""
+
+import os
+import json
+import math
+import time
+import random
+import shutil
+import tempfile
+import threading
+import argparse
+import logging
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Optional, Tuple
+
+from findmycat_client import FindMyCatClient, DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# --- Snapshots ---
+
+def record_snapshots(cache_path: str, out_path: str, count: int, poll_interval: float = 5.0) -> int:
+    """Append a snapshot of the cache to a JSONL file each time it changes"""
+    last_mtime: Optional[float] = None
+    recorded = 0
+    with open(out_path, "a") as out:
+        while recorded < count:
+            try:
+                mtime = os.path.getmtime(cache_path)
+                if last_mtime is None or mtime > last_mtime:
+                    last_mtime = mtime
+                    with open(cache_path, "r") as f:
+                        items = json.load(f)
+                    out.write(json.dumps({"captured_at": time.time(), "items": items}) + "\n")
+                    out.flush()
+                    recorded += 1
+                    logger.info(f"📸 Recorded snapshot {recorded}/{count}")
+            except (FileNotFoundError, json.JSONDecodeError, PermissionError) as e:
+                logger.error(f"Error reading Find My cache: {e}")
+            time.sleep(poll_interval)
+    return recorded
+
+
+def load_snapshots(path: str) -> List[Dict]:
+    """Load snapshots written by record_snapshots"""
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthesize_snapshots(devices: int, count: int, tick: float = 60.0,
+                         report_probability: float = 0.5, seed: int = 0) -> List[Dict]:
+    """Generate snapshots for N devices that alternate between resting and walking.
+
+    Every tick each device reports a new fix with `report_probability`;
+    otherwise its previous fix stays in the snapshot, as in the real cache.
+    """
+    rng = random.Random(seed)
+    start = time.time() - count * tick
+    state = []
+    for i in range(devices):
+        state.append({
+            "id": f"SIM-{i:04d}",
+            "lat": 37.7749 + rng.uniform(-0.05, 0.05),
+            "lon": -122.4194 + rng.uniform(-0.05, 0.05),
+            "heading": rng.uniform(0, 2 * math.pi),
+            "moving": False,
+            "ts": int(start * 1000),
+        })
+
+    snapshots = []
+    for n in range(count):
+        now = start + n * tick
+        for d in state:
+            # Switch between resting and moving now and then
+            if rng.random() < (0.05 if not d["moving"] else 0.15):
+                d["moving"] = not d["moving"]
+                d["heading"] = rng.uniform(0, 2 * math.pi)
+            if d["moving"]:
+                meters = rng.uniform(0.5, 1.5) * tick  # walking pace
+                d["heading"] += rng.gauss(0, 0.3)
+                d["lat"] += meters * math.cos(d["heading"]) / 111320
+                d["lon"] += meters * math.sin(d["heading"]) / (111320 * math.cos(math.radians(d["lat"])))
+            if rng.random() < report_probability:
+                d["ts"] = int(now * 1000)
+        snapshots.append({
+            "captured_at": now,
+            "items": [
+                {
+                    "id": d["id"],
+                    "name": d["id"],
+                    "location": {
+                        "latitude": d["lat"] + rng.gauss(0, 0.00005),
+                        "longitude": d["lon"] + rng.gauss(0, 0.00005),
+                        "timeStamp": d["ts"],
+                        "positionType": "crowdSourced",
+                        "isOld": False,
+                    },
+                }
+                for d in state
+            ],
+        })
+    return snapshots
+
+# --- Stand-in server ---
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Minimal subset of the backend API used by FindMyCatClient"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _count_received(self, body_length: int) -> None:
+        """Add the request's wire size: raw request line, headers and body"""
+        header_bytes = sum(len(f"{k}: {v}\r\n".encode("latin-1")) for k, v in self.headers.items()) + 2
+        with self.server.lock:
+            self.server.bytes_received += len(self.raw_requestline) + header_bytes + body_length
+
+    def _store(self, update: Dict) -> bool:
+        key = update["deviceId"]
+        with self.server.lock:
+            is_new = self.server.latest.get(key) != update["timestamp"]
+            self.server.latest[key] = update["timestamp"]
+        return is_new
+
+    def do_GET(self):
+        self._count_received(0)
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "timestamp": datetime.now().isoformat()})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        data = self.rfile.read(length)
+        self._count_received(len(data))
+        try:
+            body = json.loads(data or b"null")
+        except json.JSONDecodeError:
+            return self._send_json(400, {"error": "Invalid JSON"})
+
+        if self.path == "/api/locations/update":
+            is_new = self._store(body)
+            self._send_json(200, {"success": True, "location": body, "isNew": is_new})
+        elif self.path == "/api/locations/batch-update":
+            new = sum(1 for update in body if self._store(update))
+            self._send_json(200, {"success": True, "processed": len(body), "newLocations": new})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+
+def start_stand_in_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.lock = threading.Lock()
+    server.latest = {}
+    server.bytes_received = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- Replay ---
+
+class Metrics:
+    """Collects per-request stats via a requests response hook"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.written: Dict[Tuple[str, str], float] = {}
+        self.acked: Dict[Tuple[str, str], float] = {}
+        self.requests = 0
+        # Client-side estimate; the stand-in server counts the real bytes
+        self.approx_bytes_sent = 0
+
+    def on_response(self, response, *args, **kwargs):
+        now = time.perf_counter()
+        request = response.request
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode()
+        header_bytes = sum(len(k) + len(v) + 4 for k, v in request.headers.items())
+        with self.lock:
+            self.requests += 1
+            self.approx_bytes_sent += len(body) + header_bytes + len(request.method) + len(request.url) + 12
+            if response.status_code == 200 and request.method == "POST" and body:
+                updates = json.loads(body)
+                for update in updates if isinstance(updates, list) else [updates]:
+                    self.acked.setdefault((update["deviceId"], update["timestamp"]), now)
+
+    def summary(self) -> Dict:
+        latencies = sorted(
+            (self.acked[key] - written) * 1000
+            for key, written in self.written.items() if key in self.acked
+        )
+
+        def pct(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))], 2)
+
+        return {
+            "fixes_written": len(self.written),
+            "fixes_acked": len(latencies),
+            "requests": self.requests,
+            "approx_bytes_sent": self.approx_bytes_sent,
+            "latency_ms": {
+                "p50": pct(50),
+                "p95": pct(95),
+                "max": round(latencies[-1], 2) if latencies else None,
+                "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            },
+        }
+
+
+def write_snapshot(cache_path: str, items: List[Dict]) -> None:
+    """Atomically replace the cache file, like Find My rewriting Items.data"""
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(items, f)
+    os.replace(tmp_path, cache_path)
+
+
+def replay(snapshots: List[Dict], speed: float = 60.0, poll_interval: float = 0.05,
+           server_url: Optional[str] = None, settle: float = 1.0) -> Dict:
+    """Replay snapshots into a temporary cache while a client polls it"""
+    server = None if server_url else start_stand_in_server()
+    if server:
+        server_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    tmp_dir = tempfile.mkdtemp(prefix="findmycat-replay-")
+    cache_path = os.path.join(tmp_dir, "Items.data")
+    metrics = Metrics()
+    client = FindMyCatClient(server_url, cache_path=cache_path)
+    client.session.hooks["response"].append(metrics.on_response)
+
+    stop = threading.Event()
+
+    def poll():
+        while not stop.is_set():
+            if os.path.exists(cache_path):
+                client.run_once()
+            stop.wait(poll_interval)
+
+    poller = threading.Thread(target=poll, daemon=True)
+    try:
+        if not client.test_connection():
+            raise RuntimeError(f"Cannot connect to server at {server_url}")
+        poller.start()
+
+        started = time.perf_counter()
+        first_capture = snapshots[0]["captured_at"] if snapshots else 0.0
+        for snapshot in snapshots:
+            due = started + (snapshot["captured_at"] - first_capture) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            written_at = time.perf_counter()
+            write_snapshot(cache_path, snapshot["items"])
+            with metrics.lock:
+                for item in snapshot["items"]:
+                    location = item.get("location") or {}
+                    ts = location.get("timeStamp")
+                    if ts is None or location.get("isOld") or location.get("positionType") == "safeLocation":
+                        continue
+                    # Same ISO conversion the client uses for the wire format
+                    key = (item.get("id") or item.get("identifier") or "unknown",
+                           datetime.fromtimestamp(ts / 1000).isoformat())
+                    metrics.written.setdefault(key, written_at)
+
+        # Give the client time to pick up the final snapshot
+        deadline = time.perf_counter() + settle
+        while time.perf_counter() < deadline:
+            with metrics.lock:
+                if all(key in metrics.acked for key in metrics.written):
+                    break
+            time.sleep(poll_interval)
+
+        result = metrics.summary()
+        if server:
+            del result["approx_bytes_sent"]
+            with server.lock:
+                result["bytes_sent"] = server.bytes_received
+        result["snapshots"] = len(snapshots)
+        result["wall_seconds"] = round(time.perf_counter() - started, 3)
+        return result
+    finally:
+        stop.set()
+        if poller.is_alive():
+            poller.join()
+        if server:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FindMyCat replay harness - record, synthesize and replay Find My snapshots")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="Record snapshots from a live Find My cache")
+    record_parser.add_argument("--cache", default=DB_PATH, help=f"Cache to record (default: {DB_PATH})")
+    record_parser.add_argument("--out", required=True, help="JSONL file to append snapshots to")
+    record_parser.add_argument("--count", type=int, default=100, help="Number of snapshots to record (default: 100)")
+    record_parser.add_argument("--interval", type=float, default=5.0, help="Polling interval in seconds (default: 5)")
+
+    replay_parser = subparsers.add_parser("replay", help="Replay snapshots through the client and report metrics")
+    source = replay_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--snapshots", help="JSONL file written by 'record'")
+    source.add_argument("--synthetic", type=int, metavar="N", help="Generate snapshots for N devices")
+    replay_parser.add_argument("--count", type=int, default=60, help="Synthetic snapshots to generate (default: 60)")
+    replay_parser.add_argument("--tick", type=float, default=60.0, help="Seconds between synthetic snapshots (default: 60)")
+    replay_parser.add_argument("--seed", type=int, default=0, help="Random seed for synthetic data (default: 0)")
+    replay_parser.add_argument("--speed", type=float, default=60.0, help="Replay speed-up factor (default: 60)")
+    replay_parser.add_argument("--poll", type=float, default=0.05, help="Client polling interval in seconds (default: 0.05)")
+    replay_parser.add_argument("--server", help="Replay against this server instead of the local stand-in")
+    replay_parser.add_argument("--out", help="Also write the metrics JSON to this file")
+
+    parser.add_argument("--verbose", action="store_true", help="Show client logging")
+
+    args = parser.parse_args()
+
+    # The client logs every fix at INFO; keep it quiet unless asked
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    if args.command == "record":
+        record_snapshots(args.cache, args.out, args.count, args.interval)
+        return
+
+    if args.snapshots:
+        snapshots = load_snapshots(args.snapshots)
+    else:
+        snapshots = synthesize_snapshots(args.synthetic, args.count, tick=args.tick, seed=args.seed)
+
+    result = replay(snapshots, speed=args.speed, poll_interval=args.poll, server_url=args.server)
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()